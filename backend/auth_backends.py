@@ -0,0 +1,294 @@
+# backend/auth_backends.py
+
+import asyncio
+import functools
+import hashlib
+import hmac
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import ldap
+
+import database
+import models
+from config import settings
+from security import verify_password
+
+# bcrypt verification (~250 ms of CPU) and LDAP binds block, so logins run them on
+# this small dedicated pool. A burst of logins then queues here instead of
+# occupying the event loop or the threadpool every other endpoint relies on.
+_auth_executor = ThreadPoolExecutor(max_workers=settings.AUTH_WORKERS, thread_name_prefix="auth")
+
+LDAP_POOL_SIZE = settings.AUTH_WORKERS
+LDAP_TIMEOUT_SECONDS = 10
+
+# LDAP result caching
+LDAP_CACHE_TTL_SECONDS = 300 # A successful bind is trusted again for this long
+LDAP_NEGATIVE_TTL_SECONDS = 60 # The same wrong password is rejected locally for this long
+LDAP_MAX_FAILURES = 5 # Failed binds per user within LDAP_NEGATIVE_TTL_SECONDS before throttling
+LDAP_ATTRIBUTE_SYNC_INTERVAL_SECONDS = 3600
+# Usernames come from unauthenticated requests, so every cache is swept of expired
+# entries regularly and capped (oldest entries go first)
+CACHE_SWEEP_INTERVAL_SECONDS = 60
+MAX_CACHE_ENTRIES = 10000
+VERIFIER_ITERATIONS = 20000
+
+async def run_auth_task(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_auth_executor, functools.partial(func, *args))
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password, off the event loop."""
+    return await run_auth_task(verify_password, plain_password, hashed_password)
+
+class LDAPConnectionPool:
+    """
+    Reusable connections to LDAP_SERVER. Idle connections stay bound as the service
+    account (or anonymously if none is configured). A login rebinds a connection as
+    the user to check the password, then binds it back before returning it.
+    """
+    def __init__(self, size: int):
+        self.idle = queue.LifoQueue(maxsize=size)
+
+    def _bind_service_account(self, con):
+        con.simple_bind_s(settings.LDAP_BIND_DN, settings.LDAP_BIND_PASSWORD)
+
+    def _connect(self):
+        con = ldap.initialize(settings.LDAP_SERVER)
+        con.protocol_version = ldap.VERSION3
+        con.set_option(ldap.OPT_NETWORK_TIMEOUT, LDAP_TIMEOUT_SECONDS)
+        con.set_option(ldap.OPT_TIMEOUT, LDAP_TIMEOUT_SECONDS)
+        self._bind_service_account(con)
+        return con
+
+    def _acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def _release(self, con):
+        try:
+            self.idle.put_nowait(con)
+        except queue.Full:
+            con.unbind_s()
+
+    def _discard(self, con):
+        try:
+            con.unbind_s()
+        except Exception:
+            pass # Ignore errors on close
+
+    def check_credentials(self, user_dn: str, password: str):
+        """
+        Binds as the user; raises ldap.INVALID_CREDENTIALS on a wrong password.
+        A pooled connection that turns out to be dead is replaced once.
+        """
+        if not password:
+            # An empty password would be an anonymous bind, which "succeeds"
+            raise ldap.INVALID_CREDENTIALS({"desc": "Empty password"})
+
+        for attempt in range(2):
+            con = self._acquire()
+            try:
+                con.simple_bind_s(user_dn, password)
+            except ldap.INVALID_CREDENTIALS:
+                self._restore(con)
+                raise
+            except ldap.SERVER_DOWN:
+                self._discard(con)
+                if attempt == 1:
+                    raise
+                logging.warning("Pooled LDAP connection was closed by the server. Reconnecting.")
+                continue
+            except Exception:
+                self._discard(con)
+                raise
+            self._restore(con)
+            return
+
+    def _restore(self, con):
+        try:
+            self._bind_service_account(con)
+            self._release(con)
+        except Exception:
+            self._discard(con)
+
+    def search_user(self, user_dn: str) -> Optional[dict]:
+        """Reads a user's directory attributes with a pooled service-account connection."""
+        con = self._acquire()
+        try:
+            results = con.search_s(user_dn, ldap.SCOPE_BASE, attrlist=["objectGUID", "displayName", "mail"])
+        except ldap.NO_SUCH_OBJECT:
+            self._release(con)
+            return None
+        except Exception:
+            self._discard(con)
+            raise
+        self._release(con)
+        return results[0][1] if results else None
+
+    def close_all(self):
+        while True:
+            try:
+                self._discard(self.idle.get_nowait())
+            except queue.Empty:
+                return
+
+ldap_pool = LDAPConnectionPool(LDAP_POOL_SIZE)
+
+def _user_dn(username: str) -> str:
+    # ساختن distinguished name (DN) کاربر
+    return f"cn={ldap.dn.escape_dn_chars(username)},{settings.LDAP_BASE_DN}"
+
+async def ldap_check_credentials(username: str, password: str):
+    """Binds as the user on a pooled connection, off the event loop."""
+    await run_auth_task(ldap_pool.check_credentials, _user_dn(username), password)
+
+class LDAPThrottled(Exception):
+    """Too many recent failed binds for a user; the directory is not contacted."""
+
+# Never holds plaintext: positive entries keep a salted PBKDF2 verifier, negative
+# entries an HMAC keyed with a per-process secret.
+_process_secret = os.urandom(32)
+_positive_cache: Dict[str, Tuple[float, bytes, bytes]] = {} # username -> (expires_at, salt, verifier)
+_negative_cache: Dict[Tuple[str, bytes], float] = {} # (username, password hmac) -> expires_at
+_failures: Dict[str, List[float]] = {} # username -> recent failure times
+_attributes_synced_at: Dict[str, float] = {}
+_cache_lock = threading.Lock()
+_last_sweep = 0.0
+_background_tasks = set()
+
+def _cap(cache: dict):
+    # Dicts keep insertion order, so the first keys are the oldest entries
+    for key in list(cache)[:len(cache) - MAX_CACHE_ENTRIES]:
+        del cache[key]
+
+def _sweep_caches(now: float):
+    """Drops expired entries from every cache; call with _cache_lock held."""
+    global _last_sweep
+    if now - _last_sweep < CACHE_SWEEP_INTERVAL_SECONDS:
+        return
+    _last_sweep = now
+    for key in [k for k, entry in _positive_cache.items() if entry[0] <= now]:
+        del _positive_cache[key]
+    for key in [k for k, expires in _negative_cache.items() if expires <= now]:
+        del _negative_cache[key]
+    for key in [k for k, times in _failures.items() if not times or now - times[-1] >= LDAP_NEGATIVE_TTL_SECONDS]:
+        del _failures[key]
+    for key in [k for k, synced in _attributes_synced_at.items() if now - synced >= LDAP_ATTRIBUTE_SYNC_INTERVAL_SECONDS]:
+        del _attributes_synced_at[key]
+    for cache in (_positive_cache, _negative_cache, _failures, _attributes_synced_at):
+        _cap(cache)
+
+def _verifier(password: str, salt: bytes) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, VERIFIER_ITERATIONS)
+
+def _failure_key(username: str, password: str) -> Tuple[str, bytes]:
+    return username, hmac.new(_process_secret, password.encode(), hashlib.sha256).digest()
+
+def _check_cached(username: str, password: str) -> Optional[bool]:
+    """True/False when the cache can answer, None when the directory must be asked."""
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _positive_cache.get(username)
+        failures = [t for t in _failures.get(username, []) if now - t < LDAP_NEGATIVE_TTL_SECONDS]
+        if failures:
+            _failures[username] = failures
+        else:
+            _failures.pop(username, None)
+        _sweep_caches(now)
+        negative = _negative_cache.get(_failure_key(username, password))
+    if entry and entry[0] > now and hmac.compare_digest(entry[2], _verifier(password, entry[1])):
+        return True
+    if negative and negative > now:
+        return False
+    if len(failures) >= LDAP_MAX_FAILURES:
+        raise LDAPThrottled(username)
+    return None
+
+def _remember_success(username: str, password: str):
+    salt = os.urandom(16)
+    verifier = _verifier(password, salt)
+    with _cache_lock:
+        _positive_cache[username] = (time.monotonic() + LDAP_CACHE_TTL_SECONDS, salt, verifier)
+        _failures.pop(username, None)
+
+def _remember_failure(username: str, password: str):
+    now = time.monotonic()
+    with _cache_lock:
+        # A wrong password also voids any cached success (e.g. the password was changed)
+        _positive_cache.pop(username, None)
+        _negative_cache[_failure_key(username, password)] = now + LDAP_NEGATIVE_TTL_SECONDS
+        _failures.setdefault(username, []).append(now)
+        _sweep_caches(now)
+        if len(_negative_cache) > MAX_CACHE_ENTRIES or len(_failures) > MAX_CACHE_ENTRIES:
+            # Between sweeps, a flood of distinct usernames is bounded here
+            _cap(_negative_cache)
+            _cap(_failures)
+
+def _sync_user_attributes(username: str):
+    """Copies objectGUID/displayName/mail from the directory into the local user row."""
+    attributes = ldap_pool.search_user(_user_dn(username))
+    if not attributes:
+        return
+    db = database.SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.username == username, models.User.auth_source == 'ldap').first()
+        if not user:
+            return
+        if attributes.get("objectGUID"):
+            user.external_id = str(uuid.UUID(bytes_le=attributes["objectGUID"][0]))
+        if attributes.get("displayName"):
+            user.full_name = attributes["displayName"][0].decode("utf-8")
+        db.commit()
+    finally:
+        db.close()
+
+def _schedule_attribute_sync(username: str):
+    now = time.monotonic()
+    with _cache_lock:
+        if now - _attributes_synced_at.get(username, -LDAP_ATTRIBUTE_SYNC_INTERVAL_SECONDS) < LDAP_ATTRIBUTE_SYNC_INTERVAL_SECONDS:
+            return
+        _attributes_synced_at[username] = now
+        _sweep_caches(now)
+
+    async def sync():
+        try:
+            await run_auth_task(_sync_user_attributes, username)
+        except Exception as e:
+            logging.warning(f"LDAP attribute sync for '{username}' failed: {e}")
+
+    # Runs after the login response; keep a reference so the task isn't garbage collected
+    task = asyncio.create_task(sync())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def ldap_authenticate(username: str, password: str):
+    """
+    Checks LDAP credentials, answering from the result caches when possible.
+    Raises ldap.INVALID_CREDENTIALS on a wrong password and LDAPThrottled when
+    the user has failed too often recently.
+    """
+    username = username.lower()
+    cached = await run_auth_task(_check_cached, username, password)
+    if cached is False:
+        raise ldap.INVALID_CREDENTIALS({"desc": "Invalid credentials (cached)"})
+    if cached is None:
+        try:
+            await ldap_check_credentials(username, password)
+        except ldap.INVALID_CREDENTIALS:
+            _remember_failure(username, password)
+            raise
+        await run_auth_task(_remember_success, username, password)
+    _schedule_attribute_sync(username)
+
+def shutdown():
+    ldap_pool.close_all()
+    _auth_executor.shutdown(wait=False, cancel_futures=True)
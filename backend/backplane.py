@@ -0,0 +1,151 @@
+# backend/backplane.py
+
+import abc
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+from config import settings
+
+# The Redis backplane needs the optional 'redis' package (redis-py >= 4.2)
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+Handler = Callable[[str], Awaitable[None]]
+
+# Leases are plain keys holding the owner; the check and the write happen atomically
+# on the server, so two workers can never both hold one
+ACQUIRE_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+if redis.call('set', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[2]) then
+    return 1
+end
+return 0
+"""
+RELEASE_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+class Backplane(abc.ABC):
+    """
+    Pub/sub channel between the worker processes. Every message published on a
+    channel reaches the handler subscribed to it in every worker, including the
+    publishing one, so local and remote clients get messages in the same order.
+    """
+    # True when messages leave this process, i.e. other workers can receive them
+    distributed = False
+
+    @abc.abstractmethod
+    async def subscribe(self, channel: str, handler: Handler):
+        ...
+
+    @abc.abstractmethod
+    async def publish(self, channel: str, message: str):
+        ...
+
+    @abc.abstractmethod
+    async def acquire_lease(self, name: str, owner: str, ttl_seconds: int) -> bool:
+        """
+        Takes or renews a named lease that at most one worker holds at a time.
+        Returns True while `owner` holds it; an unrenewed lease expires after ttl_seconds.
+        """
+
+    async def release_lease(self, name: str, owner: str):
+        pass
+
+    async def close(self):
+        pass
+
+    async def _dispatch(self, handler: Handler, channel: str, message: str):
+        try:
+            await handler(message)
+        except Exception as e:
+            # One bad message must not stop delivery of the next ones
+            logging.error(f"Backplane: handler for '{channel}' failed: {e}")
+
+class InMemoryBackplane(Backplane):
+    """Single-process backplane: publishing calls the local handler directly."""
+    def __init__(self):
+        self.handlers: Dict[str, Handler] = {}
+
+    async def subscribe(self, channel: str, handler: Handler):
+        self.handlers[channel] = handler
+
+    async def publish(self, channel: str, message: str):
+        handler = self.handlers.get(channel)
+        if handler:
+            await self._dispatch(handler, channel, message)
+
+    async def acquire_lease(self, name: str, owner: str, ttl_seconds: int) -> bool:
+        return True # The only worker
+
+class RedisBackplane(Backplane):
+    """
+    Backplane over Redis pub/sub (or any server speaking the Redis protocol), for
+    running several gunicorn workers or several nodes. One listener task per
+    process reads every subscribed channel; redis-py re-subscribes after reconnects.
+    """
+    distributed = True
+
+    def __init__(self, url: str):
+        if not REDIS_AVAILABLE:
+            raise RuntimeError("BACKPLANE_URL is set but the 'redis' package is not installed.")
+        self.redis = aioredis.from_url(url, decode_responses=True)
+        self.pubsub = self.redis.pubsub()
+        self.handlers: Dict[str, Handler] = {}
+        self.listener: Optional[asyncio.Task] = None
+
+    async def subscribe(self, channel: str, handler: Handler):
+        self.handlers[channel] = handler
+        await self.pubsub.subscribe(channel)
+        if self.listener is None or self.listener.done():
+            self.listener = asyncio.create_task(self._listen())
+
+    async def publish(self, channel: str, message: str):
+        await self.redis.publish(channel, message)
+
+    async def acquire_lease(self, name: str, owner: str, ttl_seconds: int) -> bool:
+        return bool(await self.redis.eval(ACQUIRE_LEASE_SCRIPT, 1, name, owner, ttl_seconds))
+
+    async def release_lease(self, name: str, owner: str):
+        await self.redis.eval(RELEASE_LEASE_SCRIPT, 1, name, owner)
+
+    async def _listen(self):
+        delay = 0.5
+        while True:
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                delay = 0.5
+                if message is None:
+                    continue
+                handler = self.handlers.get(message["channel"])
+                if handler:
+                    await self._dispatch(handler, message["channel"], message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Backplane: lost connection to Redis, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10)
+
+    async def close(self):
+        if self.listener:
+            self.listener.cancel()
+        await self.pubsub.close()
+        await self.redis.close()
+
+def create_backplane() -> Backplane:
+    if settings.BACKPLANE_URL:
+        logging.info("Backplane: using Redis pub/sub.")
+        return RedisBackplane(settings.BACKPLANE_URL)
+    return InMemoryBackplane()
+
+backplane = create_backplane()
@@ -0,0 +1,76 @@
+# backend/benchmarks/login_throughput.py
+"""
+Login throughput benchmark.
+
+Fires a burst of concurrent logins at a running backend while probing an
+unrelated endpoint (/api/health), and reports login throughput alongside the
+probe latency. With password checks off the event loop, the probe latency
+should stay flat however many logins are in flight.
+
+    python benchmarks/login_throughput.py --url http://localhost:8000 \
+        --username admin --password admin --logins 200 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+async def _login(client, args, semaphore, latencies, failures):
+    async with semaphore:
+        started = time.perf_counter()
+        response = await client.post("/token", json={"username": args.username, "password": args.password, "type": args.type})
+        latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            failures.append(response.status_code)
+
+async def _probe(client, stop: asyncio.Event, latencies):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get("/api/health")
+        latencies.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.05)
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        # Baseline latency of the unrelated endpoint with no logins running
+        baseline = []
+        stop = asyncio.Event()
+        probe = asyncio.create_task(_probe(client, stop, baseline))
+        await asyncio.sleep(2)
+        stop.set()
+        await probe
+
+        login_latencies, failures, under_load = [], [], []
+        semaphore = asyncio.Semaphore(args.concurrency)
+        stop = asyncio.Event()
+        probe = asyncio.create_task(_probe(client, stop, under_load))
+        started = time.perf_counter()
+        await asyncio.gather(*[_login(client, args, semaphore, login_latencies, failures) for _ in range(args.logins)])
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probe
+
+    print(f"logins:           {args.logins} in {elapsed:.2f}s ({args.logins / elapsed * 60:.0f}/min), {len(failures)} failed")
+    print(f"login latency:    p50 {_percentile(login_latencies, 50):.0f} ms, p95 {_percentile(login_latencies, 95):.0f} ms")
+    print(f"/api/health idle: p50 {statistics.median(baseline):.1f} ms, p95 {_percentile(baseline, 95):.1f} ms")
+    print(f"/api/health load: p50 {statistics.median(under_load):.1f} ms, p95 {_percentile(under_load, 95):.1f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin")
+    parser.add_argument("--type", default="local", choices=["local", "ldap"])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,156 @@
+# backend/chat_attachments.py
+
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Optional, Set, Tuple
+
+from fastapi import HTTPException
+
+from config import settings
+
+# Thumbnails need the optional Pillow package
+try:
+    from PIL import Image
+    THUMBNAILS_AVAILABLE = True
+except ImportError:
+    THUMBNAILS_AVAILABLE = False
+
+# Attachments are stored once per distinct content, under their SHA-256:
+# uploads/chat/objects/ab/cd/abcd....  Identical uploads share one file, and a
+# name can never overwrite someone else's upload.
+ATTACHMENTS_DIR = "uploads/chat"
+OBJECTS_DIR = os.path.join(ATTACHMENTS_DIR, "objects")
+THUMBNAILS_DIR = os.path.join(ATTACHMENTS_DIR, "thumbnails")
+TMP_DIR = os.path.join(ATTACHMENTS_DIR, "tmp")
+
+MAX_ATTACHMENT_BYTES = settings.CHAT_MAX_ATTACHMENT_MB * 1024 * 1024
+WRITE_CHUNK_BYTES = 1024 * 1024
+THUMBNAIL_SIZE = (320, 320)
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+# Thumbnails are rendered here, after the upload request has returned
+_thumbnail_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-thumbnails")
+_pending_thumbnails: Set[str] = set()
+_pending_lock = threading.Lock()
+
+def object_digest(digest: str) -> str:
+    """Validates a digest from a URL."""
+    if not DIGEST_PATTERN.fullmatch(digest):
+        raise HTTPException(status_code=404, detail="File not found")
+    return digest
+
+def object_path(digest: str) -> str:
+    object_digest(digest)
+    return os.path.join(OBJECTS_DIR, digest[:2], digest[2:4], digest)
+
+def thumbnail_path(digest: str) -> str:
+    object_digest(digest)
+    return os.path.join(THUMBNAILS_DIR, digest[:2], f"{digest}.jpg")
+
+def guess_media_type(filename: str) -> str:
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+async def store_stream(chunks: AsyncIterator[bytes]) -> Tuple[str, int, bool]:
+    """
+    Writes an upload to disk as it arrives, hashing it on the way, and files it
+    under its digest. Fails with 413 as soon as MAX_ATTACHMENT_BYTES is exceeded.
+    Returns (sha256, size, whether the content was new).
+    """
+    os.makedirs(TMP_DIR, exist_ok=True)
+    tmp_path = os.path.join(TMP_DIR, uuid.uuid4().hex)
+    digest = hashlib.sha256()
+    size = 0
+    buffer = bytearray()
+    f = await asyncio.to_thread(open, tmp_path, "wb")
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > MAX_ATTACHMENT_BYTES:
+                raise HTTPException(status_code=413, detail=f"Attachments are limited to {settings.CHAT_MAX_ATTACHMENT_MB} MB.")
+            digest.update(chunk)
+            buffer += chunk
+            # Batch small network chunks into fewer, larger writes
+            if len(buffer) >= WRITE_CHUNK_BYTES:
+                await asyncio.to_thread(f.write, bytes(buffer))
+                buffer.clear()
+        if buffer:
+            await asyncio.to_thread(f.write, bytes(buffer))
+        await asyncio.to_thread(f.close)
+
+        sha256 = digest.hexdigest()
+        path = object_path(sha256)
+        if os.path.exists(path):
+            return sha256, size, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        return sha256, size, True
+    finally:
+        if not f.closed:
+            f.close()
+        _remove_quietly(tmp_path)
+
+def _render_thumbnail(digest: str):
+    try:
+        target = thumbnail_path(digest)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with Image.open(object_path(digest)) as image:
+            image.thumbnail(THUMBNAIL_SIZE)
+            tmp_target = f"{target}.{uuid.uuid4().hex}.tmp"
+            image.convert("RGB").save(tmp_target, "JPEG", quality=80)
+            os.replace(tmp_target, target)
+    except Exception as e:
+        logging.warning(f"Chat: could not create thumbnail for {digest}: {e}")
+    finally:
+        with _pending_lock:
+            _pending_thumbnails.discard(digest)
+
+def schedule_thumbnail(digest: str, media_type: str) -> bool:
+    """Queues a thumbnail for an image attachment; returns whether one will exist."""
+    if not THUMBNAILS_AVAILABLE or not media_type.startswith("image/"):
+        return False
+    if os.path.exists(thumbnail_path(digest)):
+        return True
+    with _pending_lock:
+        if digest in _pending_thumbnails:
+            return True
+        _pending_thumbnails.add(digest)
+    _thumbnail_executor.submit(_render_thumbnail, digest)
+    return True
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a single-range 'bytes=' header into an inclusive (start, end). Returns
+    None to serve the whole file; raises 416 for a range outside the file.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None # Absent, another unit, or multiple ranges: send the whole file
+    start_text, _, end_text = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # 'bytes=-500' is the last 500 bytes
+            start = max(size - int(end_text), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size - 1)
+
+def shutdown():
+    _thumbnail_executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,282 @@
+# backend/chat_writer.py
+
+import asyncio
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+from sqlalchemy import insert, text
+from sqlalchemy.exc import IntegrityError, InterfaceError, OperationalError
+
+import database
+import models
+from config import settings
+
+# --- Message IDs ---
+# Chat messages get their id before they are written, so they can be broadcast
+# first. IDs are 64-bit and time-ordered: milliseconds since ID_EPOCH_MS, a
+# 10-bit worker number and a 12-bit per-millisecond sequence.
+ID_EPOCH_MS = 1704067200000 # 2024-01-01T00:00:00Z
+WORKER_ID_COUNT = 1024
+WORKER_LEASE_SECONDS = 120
+WORKER_LEASE_RENEW_SECONDS = 30
+
+class WorkerIdLease:
+    """
+    Claims a worker number in `chat_worker_leases`, so no two processes on any
+    host stamp message ids with the same one. The lease is renewed in the
+    background; ids are only handed out while it is known to be held.
+    """
+    def __init__(self):
+        self.worker_id: Optional[int] = None
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"[:64]
+        self.valid_until = 0.0
+
+    def _try_claim(self, db, worker_id: int) -> bool:
+        params = {"worker_id": worker_id, "holder": self.holder, "ttl": WORKER_LEASE_SECONDS}
+        try:
+            db.execute(text(
+                "INSERT INTO chat_worker_leases (worker_id, holder, expires_at) "
+                "VALUES (:worker_id, :holder, UTC_TIMESTAMP() + INTERVAL :ttl SECOND)"
+            ), params)
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+        # Taken before: reclaim it only if its holder let the lease expire
+        result = db.execute(text(
+            "UPDATE chat_worker_leases SET holder = :holder, expires_at = UTC_TIMESTAMP() + INTERVAL :ttl SECOND "
+            "WHERE worker_id = :worker_id AND expires_at < UTC_TIMESTAMP()"
+        ), params)
+        db.commit()
+        return result.rowcount == 1
+
+    def claim(self):
+        """Claims CHAT_WORKER_ID if configured, otherwise any free worker number. Raises if none is free."""
+        if settings.CHAT_WORKER_ID is not None:
+            candidates = [settings.CHAT_WORKER_ID]
+        else:
+            start = random.randrange(WORKER_ID_COUNT)
+            candidates = [(start + i) % WORKER_ID_COUNT for i in range(WORKER_ID_COUNT)]
+        started = time.monotonic()
+        db = database.SessionLocal()
+        try:
+            for worker_id in candidates:
+                if self._try_claim(db, worker_id):
+                    self.worker_id = worker_id
+                    self.valid_until = started + WORKER_LEASE_SECONDS
+                    logging.info(f"Chat: claimed message id worker number {worker_id}.")
+                    return
+        finally:
+            db.close()
+        raise RuntimeError(f"Chat: no free message id worker number (tried {len(candidates)}); another process holds it.")
+
+    def renew(self) -> bool:
+        started = time.monotonic()
+        db = database.SessionLocal()
+        try:
+            result = db.execute(text(
+                "UPDATE chat_worker_leases SET expires_at = UTC_TIMESTAMP() + INTERVAL :ttl SECOND "
+                "WHERE worker_id = :worker_id AND holder = :holder"
+            ), {"worker_id": self.worker_id, "holder": self.holder, "ttl": WORKER_LEASE_SECONDS})
+            db.commit()
+        finally:
+            db.close()
+        if result.rowcount == 1:
+            self.valid_until = started + WORKER_LEASE_SECONDS
+            return True
+        return False
+
+    def release(self):
+        if self.worker_id is None:
+            return
+        db = database.SessionLocal()
+        try:
+            db.execute(text("DELETE FROM chat_worker_leases WHERE worker_id = :worker_id AND holder = :holder"),
+                       {"worker_id": self.worker_id, "holder": self.holder})
+            db.commit()
+        finally:
+            db.close()
+        self.worker_id = None
+
+    def current(self) -> int:
+        # Stop a little before the database-side expiry, so a new holder never overlaps
+        if self.worker_id is None or time.monotonic() > self.valid_until - WORKER_LEASE_RENEW_SECONDS:
+            raise RuntimeError("Chat: message id worker lease is not held; cannot assign message ids.")
+        return self.worker_id
+
+worker_lease = WorkerIdLease()
+
+_id_lock = threading.Lock()
+_last_ms = 0
+_sequence = 0
+
+def generate_message_id() -> int:
+    global _last_ms, _sequence
+    with _id_lock:
+        now_ms = int(time.time() * 1000)
+        if now_ms <= _last_ms:
+            # Same millisecond (or the clock stepped back): keep counting from the last one
+            now_ms = _last_ms
+            _sequence = (_sequence + 1) & 0xFFF
+            if _sequence == 0:
+                now_ms += 1
+        else:
+            _sequence = 0
+        _last_ms = now_ms
+        return ((now_ms - ID_EPOCH_MS) << 22) | (worker_lease.current() << 12) | _sequence
+
+# --- Write-behind Pipeline ---
+
+_STOP = object()
+# Lost connections, lock wait timeouts, server restarts: the same rows can succeed later.
+# Anything else (bad data, duplicate ids) never will, so those rows are dropped instead.
+RETRYABLE_ERRORS = (OperationalError, InterfaceError)
+
+class ChatMessageWriter:
+    """
+    Persists chat messages in small batches after they have been broadcast.
+    A batch is written when it reaches `batch_size` or `max_delay` seconds after
+    its first message, whichever comes first. The queue is bounded: when the
+    database falls behind, `submit` waits, which slows the senders down instead
+    of growing memory. `stop()` flushes everything still queued.
+    """
+    def __init__(self, batch_size: int = 200, max_delay: float = 0.2, max_queue: int = 10000):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.lease_task: Optional[asyncio.Task] = None
+        # Set by stop(); no new queue or task is started after that
+        self.closed = False
+        self.stats = {"written": 0, "batches": 0, "retries": 0, "dropped": 0}
+
+    async def start(self):
+        """Claims the message id worker number; fails (and so aborts startup) if none is free."""
+        await asyncio.to_thread(worker_lease.claim)
+        self.lease_task = asyncio.create_task(self._renew_lease())
+
+    async def _renew_lease(self):
+        while True:
+            await asyncio.sleep(WORKER_LEASE_RENEW_SECONDS)
+            try:
+                if not await asyncio.to_thread(worker_lease.renew):
+                    logging.error(f"Chat: lost message id worker number {worker_lease.worker_id}, claiming a new one.")
+                    await asyncio.to_thread(worker_lease.claim)
+            except Exception as e:
+                # Ids stop being issued once the lease runs out; keep trying meanwhile
+                logging.error(f"Chat: could not renew message id worker lease: {e}")
+
+    def _ensure_started(self):
+        if self.task is None:
+            self.queue = asyncio.Queue(maxsize=self.max_queue)
+            self.task = asyncio.create_task(self._run())
+
+    async def submit(self, row: dict):
+        if self.closed:
+            # Nothing would flush a queue started now; write the message directly instead
+            try:
+                await asyncio.to_thread(self._write_batch, [row])
+                self.stats["written"] += 1
+            except Exception as e:
+                self.stats["dropped"] += 1
+                logging.error(f"Chat: dropped message {row['id']} in room {row['room_id']} submitted during shutdown: {e}")
+            return
+        self._ensure_started()
+        await self.queue.put(row)
+
+    def _write_batch(self, rows: List[dict]):
+        db = database.SessionLocal()
+        try:
+            # A single multi-row INSERT and a single commit for the whole batch
+            db.execute(insert(models.ChatMessage.__table__), rows)
+            db.commit()
+        finally:
+            db.close()
+
+    async def _write_with_retry(self, rows: List[dict]):
+        """Writes rows in one transaction, retrying only database availability errors."""
+        delay = 0.5
+        while True:
+            try:
+                await asyncio.to_thread(self._write_batch, rows)
+                return
+            except RETRYABLE_ERRORS as e:
+                # Keep the rows and retry; meanwhile the bounded queue applies backpressure
+                self.stats["retries"] += 1
+                logging.error(f"Chat: failed to write {len(rows)} messages, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10)
+
+    async def _flush(self, rows: List[dict]):
+        try:
+            await self._write_with_retry(rows)
+            self.stats["written"] += len(rows)
+            self.stats["batches"] += 1
+            return
+        except Exception as e:
+            logging.warning(f"Chat: batch of {len(rows)} messages rejected, writing them one by one: {e}")
+        # Find the offending rows so one bad message can't hold up the others
+        for row in rows:
+            try:
+                await self._write_with_retry([row])
+                self.stats["written"] += 1
+            except Exception as e:
+                self.stats["dropped"] += 1
+                logging.error(f"Chat: dropped message {row['id']} in room {row['room_id']} from user {row['user_id']}: {e}")
+
+    async def _collect_batch(self) -> Tuple[List[dict], bool]:
+        """Returns the next batch and whether the stop marker was reached."""
+        item = await self.queue.get()
+        if item is _STOP:
+            return [], True
+        rows = [item]
+        deadline = time.monotonic() + self.max_delay
+        while len(rows) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if item is _STOP:
+                return rows, True
+            rows.append(item)
+        return rows, False
+
+    async def _run(self):
+        while True:
+            rows, stopping = await self._collect_batch()
+            if rows:
+                await self._flush(rows)
+            if stopping:
+                return
+
+    async def stop(self, timeout: float = 30):
+        """Flushes every queued message, then stops the writer."""
+        self.closed = True
+        if self.task is None:
+            return
+        # The marker queues behind every pending message, so all of them are written first
+        await self.queue.put(_STOP)
+        try:
+            await asyncio.wait_for(self.task, timeout)
+        except asyncio.TimeoutError:
+            logging.error(f"Chat: gave up flushing after {timeout}s with {self.queue.qsize()} messages still queued.")
+
+    async def release_lease(self):
+        if self.lease_task:
+            self.lease_task.cancel()
+        await asyncio.to_thread(worker_lease.release)
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "queued": self.queue.qsize() if self.queue else 0}
+
+chat_writer = ChatMessageWriter()
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseSettings
 
 class Settings(BaseSettings):
@@ -8,6 +10,31 @@ class Settings(BaseSettings):
     VAPID_PUBLIC_KEY: str = ""
     VAPID_PRIVATE_KEY: str = ""
     VAPID_CLAIMS_EMAIL: str = ""
+    # Hypervisor inventory cache (Proxmox, vCenter)
+    INVENTORY_CACHE_TTL_SECONDS: int = 15
+    INVENTORY_CACHE_STALE_SECONDS: int = 60
+    # Embed user id, role, active flag and token version in JWTs so requests
+    # can be authenticated without loading the user from the database
+    JWT_SELF_CONTAINED: bool = False
+    # LDAP / Active Directory
+    LDAP_SERVER: str = "ldap://dc.mycorp.local"
+    LDAP_BASE_DN: str = "ou=Users,dc=mycorp,dc=local"
+    # Optional service account the pooled LDAP connections are bound as between logins
+    LDAP_BIND_DN: str = ""
+    LDAP_BIND_PASSWORD: str = ""
+    # Threads for bcrypt verification and LDAP binds
+    AUTH_WORKERS: int = 4
+    # Pub/sub backplane for chat and discovery fan-out across workers, e.g.
+    # "redis://localhost:6379/0". Empty keeps everything inside one process.
+    BACKPLANE_URL: str = ""
+    # Chat message ids embed a worker number (0-1023) leased in the database.
+    # Set to pin this process to one; startup fails if another process holds it.
+    CHAT_WORKER_ID: Optional[int] = None
+    # Chat attachments
+    CHAT_MAX_ATTACHMENT_MB: int = 25
+    # When behind nginx: the internal location mapped to uploads/chat/objects,
+    # e.g. "/protected/chat-files". Downloads are then sent by nginx via X-Accel-Redirect.
+    CHAT_FILES_ACCEL_PREFIX: str = ""
 
     class Config:
         env_file = ".env"
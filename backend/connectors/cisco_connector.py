@@ -4,17 +4,24 @@ from netmiko import ConnectHandler
 from ncclient import manager
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+import hashlib
+import logging
+import threading
+import time
 import models
 
-def get_cisco_handler(db: Session, device_id: int):
-    """
-    Returns a live connection handler (Netmiko or ncclient) for a Cisco device.
-    The caller is responsible for disconnecting.
-    """
-    device = db.query(models.Device).filter(models.Device.id == device_id).first()
-    if not device or device.vendor != 'Cisco' or not device.is_active:
-        raise HTTPException(status_code=404, detail="Active Cisco device not found.")
+# Session cache tuning
+MAX_SESSION_LIFETIME_SECONDS = 3600
+IDLE_TIMEOUT_SECONDS = 600
+KEEPALIVE_INTERVAL_SECONDS = 60
+LEASE_TIMEOUT_SECONDS = 30
+# An empty subtree filter selects nothing: the device answers with an empty <data/>
+NETCONF_KEEPALIVE_FILTER = '<filter type="subtree"/>'
 
+def _connect(device: models.Device):
+    """Opens a new Netmiko or ncclient connection for a Cisco device."""
     # password = decrypt_value(device.password)
     password = device.password # Placeholder
 
@@ -44,6 +51,20 @@ def get_cisco_handler(db: Session, device_id: int):
     else:
         raise HTTPException(status_code=400, detail=f"Unsupported management protocol for Cisco device: {device.management_protocol}")
 
+def _get_cisco_device(db: Session, device_id: int) -> models.Device:
+    device = db.query(models.Device).filter(models.Device.id == device_id).first()
+    if not device or device.vendor != 'Cisco' or not device.is_active:
+        raise HTTPException(status_code=404, detail="Active Cisco device not found.")
+    return device
+
+def get_cisco_handler(db: Session, device_id: int):
+    """
+    Returns a live connection handler (Netmiko or ncclient) for a Cisco device.
+    The caller is responsible for disconnecting.
+    Prefer `cisco_session`, which reuses an already-established session.
+    """
+    return _connect(_get_cisco_device(db, device_id))
+
 def close_cisco_handler(handler, protocol: str):
     if handler:
         try:
@@ -53,3 +74,185 @@ def close_cisco_handler(handler, protocol: str):
                 handler.close_session()
         except Exception:
             pass # Ignore errors on close
+
+def _is_alive(handler, protocol: str) -> bool:
+    try:
+        if protocol == 'ssh':
+            return handler.is_alive()
+        return handler.connected
+    except Exception:
+        return False
+
+def _send_keepalive(handler, protocol: str) -> bool:
+    """
+    Like _is_alive, but always puts traffic on the wire, so NAT and firewall
+    mappings of idle sessions don't expire. Returns False if the session is dead.
+    """
+    try:
+        if protocol == 'ssh':
+            # Netmiko writes a null byte to the channel and checks the transport
+            return handler.is_alive()
+        handler.get(filter=NETCONF_KEEPALIVE_FILTER)
+        return True
+    except Exception:
+        return False
+
+class CachedCiscoSession:
+    """
+    A long-lived Netmiko/ncclient session. Netmiko channels are not thread-safe,
+    so every use goes through `lock` and a session serves one caller at a time.
+    """
+    def __init__(self, handler, protocol: str):
+        self.handler = handler
+        self.protocol = protocol
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.lock = threading.Lock()
+
+    def is_expired(self) -> bool:
+        now = time.monotonic()
+        return (now - self.created_at > MAX_SESSION_LIFETIME_SECONDS or
+                now - self.last_used > IDLE_TIMEOUT_SECONDS)
+
+    def close(self):
+        close_cisco_handler(self.handler, self.protocol)
+
+class CiscoSessionCache:
+    """Keeps one warm SSH or NETCONF session per Cisco device and connection settings."""
+    def __init__(self):
+        self.sessions: Dict[Tuple[int, str], CachedCiscoSession] = {}
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "reconnects": 0, "expired": 0}
+        self._keepalive_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _key(device: models.Device) -> Tuple[int, str]:
+        raw = f"{device.management_protocol}|{device.host}|{device.port}|{device.username}|{device.password}|{device.os_type}"
+        return device.id, hashlib.sha256(raw.encode()).hexdigest()
+
+    def _count(self, name: str):
+        with self.lock:
+            self.stats[name] += 1
+
+    def _drop(self, key, session: CachedCiscoSession):
+        with self.lock:
+            if self.sessions.get(key) is session:
+                del self.sessions[key]
+        session.close()
+
+    @contextmanager
+    def lease(self, device: models.Device):
+        """Leases the device's cached session, connecting (or reconnecting) when needed."""
+        self._ensure_keepalive()
+        key = self._key(device)
+
+        with self.lock:
+            # Drop sessions left over from older connection settings of this device
+            for stale_key in [k for k in self.sessions if k[0] == device.id and k != key]:
+                self.sessions.pop(stale_key).close()
+            session = self.sessions.get(key)
+
+        if session is not None:
+            if not session.lock.acquire(timeout=LEASE_TIMEOUT_SECONDS):
+                raise HTTPException(status_code=503, detail=f"Session to {device.name} is busy.")
+            if session.is_expired() or not _is_alive(session.handler, session.protocol):
+                self._count("reconnects")
+                session.lock.release()
+                self._drop(key, session)
+                session = None
+            else:
+                self._count("hits")
+
+        transient = False
+        if session is None:
+            self._count("misses")
+            session = CachedCiscoSession(_connect(device), device.management_protocol)
+            session.lock.acquire()
+            with self.lock:
+                if key in self.sessions:
+                    # Another caller cached a session for this device first; use ours once and close it
+                    transient = True
+                else:
+                    self.sessions[key] = session
+
+        broken = False
+        try:
+            yield session.handler
+        except HTTPException:
+            raise
+        except Exception:
+            broken = True
+            raise
+        finally:
+            session.last_used = time.monotonic()
+            session.lock.release()
+            if transient:
+                session.close()
+            elif broken and not _is_alive(session.handler, session.protocol):
+                self._drop(key, session)
+
+    def _keepalive_pass(self):
+        with self.lock:
+            items = list(self.sessions.items())
+        for key, session in items:
+            # Never interrupt a session that is in use
+            if not session.lock.acquire(blocking=False):
+                continue
+            try:
+                expired = session.is_expired()
+                alive = not expired and _send_keepalive(session.handler, session.protocol)
+            finally:
+                session.lock.release()
+            if expired:
+                self._count("expired")
+            if not alive:
+                self._drop(key, session)
+
+    def _keepalive_loop(self):
+        while not self._stop.wait(KEEPALIVE_INTERVAL_SECONDS):
+            try:
+                self._keepalive_pass()
+            except Exception as e:
+                logging.error(f"Cisco session keepalive failed: {e}")
+
+    def _ensure_keepalive(self):
+        if self._keepalive_thread is None:
+            with self.lock:
+                if self._keepalive_thread is None:
+                    self._keepalive_thread = threading.Thread(
+                        target=self._keepalive_loop, name="cisco-session-keepalive", daemon=True
+                    )
+                    self._keepalive_thread.start()
+
+    def invalidate(self, device_id: int):
+        with self.lock:
+            stale = [(k, s) for k, s in self.sessions.items() if k[0] == device_id]
+            for k, _ in stale:
+                del self.sessions[k]
+        for _, session in stale:
+            session.close()
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {**self.stats, "sessions": len(self.sessions)}
+
+    def close_all(self):
+        self._stop.set()
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            session.close()
+
+session_cache = CiscoSessionCache()
+
+@contextmanager
+def cisco_session(db: Session, device_id: int):
+    """
+    Leases the cached Netmiko or ncclient session for a Cisco device.
+    Use as `with cisco_session(db, device_id) as handler:`; do not close the handler.
+    """
+    device = _get_cisco_device(db, device_id)
+    with session_cache.lease(device) as handler:
+        yield handler
@@ -4,17 +4,38 @@ import docker
 from docker.tls import TLSConfig
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
+from typing import Dict, Tuple
+import time
 import models
 import logging
 
+# Docker clients are reused per host; the key changes when the host's connection settings do
+docker_clients: Dict[int, Tuple[tuple, docker.DockerClient, float]] = {} # host_id -> (settings, client, last ping)
+# A reused client is pinged again when its last successful ping is older than this
+PING_INTERVAL_SECONDS = 60
+
 def get_docker_client(db: Session, host_id: int):
     """
-    Initializes and returns a Docker client connected to a specific Docker host.
+    Returns a Docker client connected to a specific Docker host.
+    Clients are reused; the daemon is pinged when a client is created and then
+    at most every PING_INTERVAL_SECONDS, and a client that fails the ping is replaced.
     """
     host = db.query(models.DockerHost).filter(models.DockerHost.id == host_id).first()
     if not host:
         raise HTTPException(status_code=404, detail="Docker host not found.")
 
+    settings_key = (host.docker_url, host.tls_cert_path, host.tls_key_path)
+    cached = docker_clients.get(host_id)
+    if cached and cached[0] == settings_key:
+        if time.monotonic() - cached[2] < PING_INTERVAL_SECONDS:
+            return cached[1]
+        try:
+            if cached[1].ping():
+                docker_clients[host_id] = (settings_key, cached[1], time.monotonic())
+                return cached[1]
+        except Exception as e:
+            logging.warning(f"Reused Docker client for '{host.name}' failed its ping, reconnecting: {e}")
+
     try:
         tls_config = None
         # If TLS paths are provided in the DB, configure TLS for a secure connection
@@ -32,6 +53,9 @@ def get_docker_client(db: Session, host_id: int):
             raise Exception("Docker daemon is not responding.")
         
         logging.info(f"Successfully connected to Docker host '{host.name}'.")
+        if cached:
+            cached[1].close()
+        docker_clients[host_id] = (settings_key, client, time.monotonic())
         return client
 
     except docker.errors.DockerException as e:
@@ -40,3 +64,8 @@ def get_docker_client(db: Session, host_id: int):
     except Exception as e:
         logging.error(f"An unexpected error occurred while connecting to Docker host '{host.name}': {e}")
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
+
+def close_docker_clients():
+    for _, client, _ in docker_clients.values():
+        client.close()
+    docker_clients.clear()
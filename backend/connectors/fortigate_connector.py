@@ -4,6 +4,7 @@ import httpx
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
 import models
+from connectors.http_clients import get_http_client
 
 class FortiGateAPIClient:
     def __init__(self, db: Session, device_id: int):
@@ -16,12 +17,13 @@ class FortiGateAPIClient:
         api_key = device.api_key # Placeholder
         
         self.headers = {"Authorization": f"Bearer {api_key}"}
-        self.client = httpx.AsyncClient(verify=False) # For production, manage certs
+        # Shared per firewall, so polling reuses warm connections; replaced when the API key changes
+        self.client = get_http_client(f"fortigate:{device_id}", self.base_url, self.headers)
 
     async def get_monitor(self, endpoint: str):
         url = f"{self.base_url}/api/v2/monitor/{endpoint}"
         try:
-            response = await self.client.get(url, headers=self.headers)
+            response = await self.client.get(url)
             response.raise_for_status()
             return response.json()
         except httpx.HTTPStatusError as e:
@@ -0,0 +1,91 @@
+# connectors/http_clients.py
+
+import asyncio
+import hashlib
+import httpx
+import logging
+from typing import Dict, List, Optional, Tuple
+
+# HTTP/2 needs the optional 'h2' package (pip install httpx[http2])
+try:
+    import h2 # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+CLIENT_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=120)
+CLIENT_TIMEOUT = httpx.Timeout(15.0, connect=5.0)
+# A replaced client is closed once requests already using it have had time to finish
+RETIRE_GRACE_SECONDS = 30
+
+# Process-wide registry of long-lived clients: server key -> (fingerprint, client)
+_clients: Dict[str, Tuple[str, httpx.AsyncClient]] = {}
+# Replaced clients not closed yet; whatever is left is closed at shutdown
+_retired: List[httpx.AsyncClient] = []
+_background_tasks = set()
+
+def _fingerprint(base_url: str, headers: Optional[dict]) -> str:
+    raw = base_url + "|" + "|".join(f"{k}={v}" for k, v in sorted((headers or {}).items()))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+async def _close_later(client: httpx.AsyncClient):
+    await asyncio.sleep(RETIRE_GRACE_SECONDS)
+    if client in _retired:
+        _retired.remove(client)
+    try:
+        await client.aclose()
+    except Exception as e:
+        logging.warning(f"Error closing replaced HTTP client: {e}")
+
+def _retire(client: httpx.AsyncClient):
+    _retired.append(client)
+    try:
+        task = asyncio.get_running_loop().create_task(_close_later(client))
+    except RuntimeError:
+        return # No event loop here; close_all_clients() picks it up
+    # Keep a reference so the task isn't garbage collected
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+def get_http_client(server_key: str, base_url: str, headers: Optional[dict] = None, http2: bool = True) -> httpx.AsyncClient:
+    """
+    Returns the shared AsyncClient for a server (e.g. "proxmox:3"), creating it on first use.
+    Reusing the client keeps TLS sessions and keep-alive connections warm across requests.
+    When the server's address or credentials change, the previous client is replaced and
+    closed. Clients are closed by `close_all_clients()` at application shutdown; callers
+    must not close them.
+    """
+    fingerprint = _fingerprint(base_url, headers)
+    entry = _clients.get(server_key)
+    if entry is not None and entry[0] != fingerprint:
+        _retire(entry[1])
+        logging.info(f"Replacing shared HTTP client for {server_key}: address or credentials changed.")
+        entry = None
+    client = entry[1] if entry is not None else None
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            verify=False, # For production, manage certs
+            http2=http2 and HTTP2_AVAILABLE,
+            limits=CLIENT_LIMITS,
+            timeout=CLIENT_TIMEOUT,
+        )
+        _clients[server_key] = (fingerprint, client)
+        logging.info(f"Created shared HTTP client for {server_key} ({base_url}).")
+    return client
+
+def get_client_stats() -> dict:
+    return {"clients": len(_clients), "http2_available": HTTP2_AVAILABLE}
+
+async def close_all_clients():
+    for task in list(_background_tasks):
+        task.cancel()
+    clients = [client for _, client in _clients.values()] + _retired
+    _clients.clear()
+    _retired.clear()
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception as e:
+            logging.warning(f"Error closing shared HTTP client: {e}")
@@ -0,0 +1,96 @@
+# connectors/inventory_cache.py
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from config import settings
+
+class CacheEntry:
+    def __init__(self, value: Any):
+        self.value = value
+        self.fetched_at = time.monotonic()
+
+class InventoryCache:
+    """
+    Read-through cache for hypervisor inventory reads.
+    Fresh entries (younger than `ttl`) are served directly. Entries that are
+    stale but younger than `ttl + stale_ttl` are served immediately while one
+    background refresh runs. Anything older is fetched before returning.
+    Concurrent misses for the same key share a single backend request.
+    Keys are tuples whose first element is the server id, so a write can drop
+    everything cached for that server.
+    """
+    def __init__(self, name: str, ttl: int, stale_ttl: int):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.entries: Dict[Hashable, CacheEntry] = {}
+        self.inflight: Dict[Hashable, asyncio.Future] = {}
+        # Bumped on every invalidation so fetches that started before a write don't repopulate the cache
+        self.generations: Dict[int, int] = {}
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refresh_errors": 0, "invalidations": 0}
+
+    def _fetch(self, key: Hashable, fetcher: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        if key not in self.inflight:
+            generation = self.generations.get(key[0], 0)
+            async def run():
+                try:
+                    value = await fetcher()
+                    if self.generations.get(key[0], 0) == generation:
+                        self.entries[key] = CacheEntry(value)
+                    return value
+                finally:
+                    if self.inflight.get(key) is asyncio.current_task():
+                        del self.inflight[key]
+            self.inflight[key] = asyncio.ensure_future(run())
+        return self.inflight[key]
+
+    def _refresh_in_background(self, key: Hashable, fetcher: Callable[[], Awaitable[Any]]):
+        def on_done(future: asyncio.Future):
+            if not future.cancelled() and future.exception() is not None:
+                # Keep serving the stale value; the next read will try again
+                self.stats["refresh_errors"] += 1
+                logging.warning(f"Background refresh of {self.name} cache key {key} failed: {future.exception()}")
+        self._fetch(key, fetcher).add_done_callback(on_done)
+
+    async def get_or_fetch(self, key: Hashable, fetcher: Callable[[], Awaitable[Any]]):
+        entry = self.entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.fetched_at
+            if age < self.ttl:
+                self.stats["hits"] += 1
+                return entry.value
+            if age < self.ttl + self.stale_ttl:
+                self.stats["stale_hits"] += 1
+                self._refresh_in_background(key, fetcher)
+                return entry.value
+
+        self.stats["misses"] += 1
+        # shield() keeps a cancelled request from cancelling a fetch other callers wait on
+        return await asyncio.shield(self._fetch(key, fetcher))
+
+    def invalidate(self, server_id: int):
+        """Drops every cached entry for one server, e.g. after a start/stop action."""
+        for key in [k for k in self.entries if k[0] == server_id]:
+            del self.entries[key]
+        for key in [k for k in self.inflight if k[0] == server_id]:
+            # Later readers must not join a fetch that may predate the write
+            self.inflight.pop(key)
+        self.generations[server_id] = self.generations.get(server_id, 0) + 1
+        self.stats["invalidations"] += 1
+
+    def get_stats(self) -> dict:
+        reads = self.stats["hits"] + self.stats["stale_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self.entries),
+            "hit_ratio": round((self.stats["hits"] + self.stats["stale_hits"]) / reads, 3) if reads else None,
+        }
+
+proxmox_cache = InventoryCache("proxmox", settings.INVENTORY_CACHE_TTL_SECONDS, settings.INVENTORY_CACHE_STALE_SECONDS)
+vmware_cache = InventoryCache("vmware", settings.INVENTORY_CACHE_TTL_SECONDS, settings.INVENTORY_CACHE_STALE_SECONDS)
+
+def get_inventory_cache_stats() -> dict:
+    return {cache.name: cache.get_stats() for cache in (proxmox_cache, vmware_cache)}
@@ -0,0 +1,47 @@
+# connectors/mikrotik_async.py
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+import database
+from connectors.mikrotik_connector import run_api_call, MAX_SESSIONS_PER_DEVICE
+
+# routeros_api is fully blocking, so every device round trip runs on this executor.
+# The executor bounds total RouterOS work in the process; the per-device semaphores
+# stop one slow router from occupying every worker thread.
+MAX_WORKERS = 32
+MAX_CONCURRENT_PER_DEVICE = MAX_SESSIONS_PER_DEVICE
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="mikrotik")
+_device_semaphores: Dict[int, asyncio.Semaphore] = {}
+
+def _get_device_semaphore(device_id: int) -> asyncio.Semaphore:
+    if device_id not in _device_semaphores:
+        _device_semaphores[device_id] = asyncio.Semaphore(MAX_CONCURRENT_PER_DEVICE)
+    return _device_semaphores[device_id]
+
+async def run_blocking(device_id: int, func, *args, **kwargs):
+    """Runs a blocking RouterOS call for a device on the shared MikroTik executor."""
+    loop = asyncio.get_running_loop()
+    async with _get_device_semaphore(device_id):
+        return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+def _get_resource_sync(device_id: int, path: str, **kwargs):
+    # Runs on an executor thread, so it opens its own session; a Session must not be shared between threads
+    db = database.SessionLocal()
+    try:
+        return run_api_call(db, device_id, lambda api: api.get_resource(path).get(**kwargs))
+    finally:
+        db.close()
+
+async def get_resource(device_id: int, path: str, **kwargs):
+    """
+    Async equivalent of `get_api_connector(db, device_id).get_resource(path).get()`.
+    HTTPExceptions raised by the connector propagate unchanged.
+    """
+    return await run_blocking(device_id, _get_resource_sync, device_id, path, **kwargs)
+
+def shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -3,35 +3,66 @@
 import routeros_api
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+import hashlib
+import threading
+import time
 import models
 import logging
 
-# A dictionary to manage connection pools for multiple devices
-connection_pools = {}
+MAX_SESSIONS_PER_DEVICE = 4
+IDLE_TIMEOUT_SECONDS = 300
+PROBE_INTERVAL_SECONDS = 60
+LEASE_TIMEOUT_SECONDS = 10
+# Devices probed in parallel by the maintenance pass; one dead router only holds up its own thread
+PROBE_WORKERS = 8
 
-def get_api_connector(db: Session, device_id: int):
+def _device_fingerprint(device: models.Device) -> str:
+    """Identifies the connection settings of a device; any change invalidates its pool."""
+    raw = f"{device.host}|{device.port or 8728}|{device.username}|{device.password}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+class PooledSession:
+    """A single RouterOS API session owned by a DevicePool."""
+    def __init__(self, pool: routeros_api.RouterOsApiPool):
+        self.pool = pool
+        self.api = pool.get_api()
+        self.last_used = time.monotonic()
+
+    def close(self):
+        try:
+            self.pool.disconnect()
+        except Exception:
+            pass # Ignore errors on close
+
+class DevicePool:
+    """Idle sessions and lease accounting for one device."""
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.idle: List[PooledSession] = []
+        self.in_use = 0
+
+class MikroTikPoolManager:
     """
-    Gets a connection from a pool for a specific MikroTik device.
-    Creates a new pool if one doesn't exist.
+    Bounded RouterOS session pool for all MikroTik devices.
+    Sessions are leased per operation and returned afterwards; idle sessions are
+    evicted after IDLE_TIMEOUT_SECONDS and probed for liveness in the background.
     """
-    device = db.query(models.Device).filter(models.Device.id == device_id).first()
-    if not device or device.vendor != 'MikroTik' or not device.is_active:
-        raise HTTPException(status_code=404, detail="Active MikroTik device not found.")
+    def __init__(self):
+        self.pools: Dict[int, DevicePool] = {}
+        self.lock = threading.Condition()
+        self.stats = {"hits": 0, "misses": 0, "reconnects": 0, "evictions": 0, "invalidations": 0}
+        self._maintenance_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._probe_executor = ThreadPoolExecutor(max_workers=PROBE_WORKERS, thread_name_prefix="mikrotik-probe")
 
-    if device_id in connection_pools:
-        pool = connection_pools[device_id]
-        if not pool.is_closed():
-            try:
-                return pool.get_api()
-            except routeros_api.exceptions.RouterOsApiConnectionError:
-                logging.warning(f"Connection pool for device {device_id} seems stale. Reconnecting.")
-                pool.disconnect()
-    
-    try:
+    def _open_session(self, device: models.Device) -> PooledSession:
         # Decrypt password before connecting
         # password = decrypt_value(device.password)
         password = device.password # Placeholder for decrypted password
-        
+
         pool = routeros_api.RouterOsApiPool(
             host=device.host,
             username=device.username,
@@ -39,10 +70,212 @@ def get_api_connector(db: Session, device_id: int):
             port=device.port or 8728,
             plaintext_login=True
         )
-        connection_pools[device_id] = pool
-        return pool.get_api()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Could not connect to MikroTik device {device.name}: {e}")
+        return PooledSession(pool)
+
+    def _acquire(self, device: models.Device) -> Tuple[DevicePool, PooledSession, bool]:
+        """Returns (pool, session, whether the session was reused from the idle list)."""
+        fingerprint = _device_fingerprint(device)
+        deadline = time.monotonic() + LEASE_TIMEOUT_SECONDS
+
+        with self.lock:
+            device_pool = self.pools.get(device.id)
+            if device_pool and device_pool.fingerprint != fingerprint:
+                logging.info(f"Connection settings for MikroTik device {device.id} changed. Invalidating its pool.")
+                self._invalidate_locked(device.id)
+                device_pool = None
+            if device_pool is None:
+                device_pool = DevicePool(fingerprint)
+                self.pools[device.id] = device_pool
+
+            while not device_pool.idle and device_pool.in_use >= MAX_SESSIONS_PER_DEVICE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise HTTPException(status_code=503, detail=f"All sessions to MikroTik device {device.name} are busy.")
+                self.lock.wait(remaining)
+
+            device_pool.in_use += 1
+            if device_pool.idle:
+                self.stats["hits"] += 1
+                return device_pool, device_pool.idle.pop(), True
+            self.stats["misses"] += 1
+
+        # Connect outside the lock so a slow router doesn't block other devices
+        try:
+            return device_pool, self._open_session(device), False
+        except Exception as e:
+            with self.lock:
+                device_pool.in_use -= 1
+                self.lock.notify_all()
+            raise HTTPException(status_code=500, detail=f"Could not connect to MikroTik device {device.name}: {e}")
+
+    def _release(self, device_id: int, device_pool: DevicePool, session: PooledSession, broken: bool, touch: bool = True):
+        with self.lock:
+            device_pool.in_use -= 1
+            if self.pools.get(device_id) is not device_pool:
+                # The pool was invalidated while this session was leased
+                session.close()
+                return
+            if broken:
+                self.stats["reconnects"] += 1
+                session.close()
+            else:
+                if touch:
+                    session.last_used = time.monotonic()
+                device_pool.idle.append(session)
+            self.lock.notify_all()
+
+    @contextmanager
+    def lease(self, device: models.Device):
+        self._ensure_maintenance()
+        device_pool, session, _ = self._acquire(device)
+        broken = False
+        try:
+            yield session.api
+        except routeros_api.exceptions.RouterOsApiConnectionError as e:
+            logging.warning(f"Session to MikroTik device {device.id} failed. It will be replaced.")
+            broken = True
+            raise HTTPException(status_code=503, detail=f"Connection to MikroTik device {device.name} was lost: {e}")
+        finally:
+            self._release(device.id, device_pool, session, broken)
+
+    def run(self, device: models.Device, func: Callable):
+        """
+        Calls `func(api)` on a leased session. If a reused session turns out to be
+        dead (e.g. the router restarted since it was pooled), the device's other idle
+        sessions are dropped too and the call is retried once on a fresh connection.
+        """
+        self._ensure_maintenance()
+        for attempt in (1, 2):
+            device_pool, session, reused = self._acquire(device)
+            broken = False
+            try:
+                return func(session.api)
+            except routeros_api.exceptions.RouterOsApiConnectionError as e:
+                broken = True
+                if not (reused and attempt == 1):
+                    raise HTTPException(status_code=503, detail=f"Connection to MikroTik device {device.name} was lost: {e}")
+                logging.warning(f"Stale pooled session to MikroTik device {device.id}. Retrying on a new connection.")
+                self._discard_idle(device.id, device_pool)
+            finally:
+                self._release(device.id, device_pool, session, broken)
+
+    def _discard_idle(self, device_id: int, device_pool: DevicePool):
+        with self.lock:
+            if self.pools.get(device_id) is device_pool:
+                for session in device_pool.idle:
+                    session.close()
+                    self.stats["reconnects"] += 1
+                device_pool.idle = []
+
+    def _invalidate_locked(self, device_id: int):
+        device_pool = self.pools.pop(device_id, None)
+        if device_pool:
+            self.stats["invalidations"] += 1
+            for session in device_pool.idle:
+                session.close()
+            self.lock.notify_all()
+
+    def invalidate(self, device_id: int):
+        """Drops every pooled session for a device, e.g. after its Device row changed."""
+        with self.lock:
+            self._invalidate_locked(device_id)
+
+    def evict_idle(self):
+        now = time.monotonic()
+        with self.lock:
+            for device_id, device_pool in list(self.pools.items()):
+                expired = [s for s in device_pool.idle if now - s.last_used > IDLE_TIMEOUT_SECONDS]
+                for session in expired:
+                    device_pool.idle.remove(session)
+                    session.close()
+                    self.stats["evictions"] += 1
+                if not device_pool.idle and device_pool.in_use == 0:
+                    del self.pools[device_id]
+
+    def _probe_device(self, device_id: int, device_pool: DevicePool, sessions: List[PooledSession]):
+        # One session at a time, so the device's other idle sessions stay available for leases
+        for session in sessions:
+            with self.lock:
+                if self.pools.get(device_id) is not device_pool or session not in device_pool.idle:
+                    continue # Leased or dropped in the meantime
+                device_pool.idle.remove(session)
+                device_pool.in_use += 1
+            broken = False
+            try:
+                session.api.get_resource('/system/identity').get()
+            except Exception:
+                logging.warning(f"Liveness probe failed for a session to MikroTik device {device_id}.")
+                broken = True
+            # A probe is not real use; keep the idle clock running
+            self._release(device_id, device_pool, session, broken, touch=False)
+
+    def probe_idle(self):
+        """Checks idle sessions with a cheap command and drops the dead ones. Devices are probed in parallel."""
+        with self.lock:
+            work = [(device_id, device_pool, list(device_pool.idle)) for device_id, device_pool in self.pools.items() if device_pool.idle]
+        futures = [self._probe_executor.submit(self._probe_device, *item) for item in work]
+        for future in futures:
+            future.result()
+
+    def _maintenance_loop(self):
+        while not self._stop.wait(PROBE_INTERVAL_SECONDS):
+            try:
+                self.evict_idle()
+                self.probe_idle()
+            except Exception as e:
+                logging.error(f"MikroTik pool maintenance failed: {e}")
+
+    def _ensure_maintenance(self):
+        if self._maintenance_thread is None:
+            with self.lock:
+                if self._maintenance_thread is None:
+                    self._maintenance_thread = threading.Thread(
+                        target=self._maintenance_loop, name="mikrotik-pool-maintenance", daemon=True
+                    )
+                    self._maintenance_thread.start()
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                **self.stats,
+                "devices": len(self.pools),
+                "idle_sessions": sum(len(p.idle) for p in self.pools.values()),
+                "leased_sessions": sum(p.in_use for p in self.pools.values()),
+            }
+
+    def close_all(self):
+        self._stop.set()
+        self._probe_executor.shutdown(wait=False, cancel_futures=True)
+        with self.lock:
+            for device_id in list(self.pools):
+                self._invalidate_locked(device_id)
+
+pool_manager = MikroTikPoolManager()
+
+def _get_active_device(db: Session, device_id: int) -> models.Device:
+    device = db.query(models.Device).filter(models.Device.id == device_id).first()
+    if not device or device.vendor != 'MikroTik' or not device.is_active:
+        pool_manager.invalidate(device_id)
+        raise HTTPException(status_code=404, detail="Active MikroTik device not found.")
+    return device
+
+@contextmanager
+def get_api_connector(db: Session, device_id: int):
+    """
+    Leases a pooled API connection for a specific MikroTik device.
+    Use as `with get_api_connector(db, device_id) as api:`; the session is
+    returned to the pool when the block exits.
+    """
+    with pool_manager.lease(_get_active_device(db, device_id)) as api:
+        yield api
+
+def run_api_call(db: Session, device_id: int, func: Callable):
+    """
+    Runs `func(api)` on a pooled connection, retrying once on a fresh connection
+    if the pooled one went stale. Prefer this over get_api_connector for single,
+    repeatable (read) operations.
+    """
+    return pool_manager.run(_get_active_device(db, device_id), func)
 
 def create_dedicated_mikrotik_connection(db: Session, device_id: int):
     """Creates a single, dedicated connection for tasks like CLI or monitoring."""
@@ -0,0 +1,154 @@
+# connectors/mikrotik_traffic.py
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+import database
+from connectors.mikrotik_connector import create_dedicated_mikrotik_connection
+from connectors.mikrotik_async import run_blocking
+
+POLL_INTERVAL_SECONDS = 1
+# Updates are dropped (oldest first) for a subscriber that falls this far behind
+SUBSCRIBER_QUEUE_SIZE = 5
+
+
+class TrafficPoller:
+    """
+    Polls interface counters for a single MikroTik device and fans the computed
+    rates out to every subscribed WebSocket. One poller (and one RouterOS session)
+    exists per device, no matter how many browser tabs are watching it.
+    """
+    def __init__(self, device_id: int):
+        self.device_id = device_id
+        self.subscribers: List[asyncio.Queue] = []
+        self.interface_names: Optional[List[str]] = None
+        self.poll_count = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    def add_subscriber(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        # Late joiners still need the interface list the poller sent at startup
+        if self.interface_names is not None:
+            queue.put_nowait({"type": "interfaces_list", "data": self.interface_names})
+        self.subscribers.append(queue)
+        return queue
+
+    def remove_subscriber(self, queue: asyncio.Queue):
+        if queue in self.subscribers:
+            self.subscribers.remove(queue)
+
+    def _publish(self, message: Optional[dict]):
+        for queue in self.subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    def _open_connection(self):
+        # The poller outlives the request that started it, so it uses its own session
+        db = database.SessionLocal()
+        try:
+            return create_dedicated_mikrotik_connection(db, self.device_id)
+        finally:
+            db.close()
+
+    async def _run(self):
+        api_connection = None
+        try:
+            # Inside the try, so subscribers also hear about a failed connection attempt
+            api_connection = await run_blocking(self.device_id, self._open_connection)
+            if not api_connection:
+                # None tells every subscriber that the device is unreachable
+                self._publish(None)
+                return
+
+            interface_resource = api_connection.get_resource('/interface')
+            interfaces = await run_blocking(self.device_id, interface_resource.get)
+            self.interface_names = [iface['name'] for iface in interfaces if not iface.get('disabled') == 'true']
+            self._publish({"type": "interfaces_list", "data": self.interface_names})
+
+            last_stats = {}
+            last_poll = None
+
+            while True:
+                stats_list = await run_blocking(self.device_id, interface_resource.get, proplist="name,rx-byte,tx-byte")
+                now = time.monotonic()
+                self.poll_count += 1
+
+                current_stats = {
+                    stats['name']: {'rx': int(stats['rx-byte']), 'tx': int(stats['tx-byte'])}
+                    for stats in stats_list
+                }
+
+                rates = {}
+                if last_stats:
+                    elapsed = (now - last_poll) or POLL_INTERVAL_SECONDS
+                    for name in self.interface_names:
+                        if name in current_stats and name in last_stats:
+                            rx_rate = (current_stats[name]['rx'] - last_stats[name]['rx']) / elapsed # bytes per second
+                            tx_rate = (current_stats[name]['tx'] - last_stats[name]['tx']) / elapsed # bytes per second
+                            rates[name] = {'rx_bps': int(rx_rate * 8), 'tx_bps': int(tx_rate * 8)} # bits per second
+
+                last_stats = current_stats
+                last_poll = now
+
+                if rates:
+                    self._publish({"type": "traffic_update", "data": rates})
+
+                await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Traffic poller error for device {self.device_id}: {e}")
+            self._publish(None)
+        finally:
+            if api_connection:
+                await run_blocking(self.device_id, api_connection.close)
+
+
+class TrafficPollerRegistry:
+    """Reference-counted registry of per-device traffic pollers."""
+    def __init__(self):
+        self.pollers: Dict[int, TrafficPoller] = {}
+
+    def subscribe(self, device_id: int) -> asyncio.Queue:
+        poller = self.pollers.get(device_id)
+        if poller is None or poller.task is None or poller.task.done():
+            poller = TrafficPoller(device_id)
+            self.pollers[device_id] = poller
+            poller.start()
+            logging.info(f"Started traffic poller for device {device_id}.")
+        return poller.add_subscriber()
+
+    def unsubscribe(self, device_id: int, queue: asyncio.Queue):
+        poller = self.pollers.get(device_id)
+        if poller is None:
+            return
+        poller.remove_subscriber(queue)
+        if not poller.subscribers:
+            # Last viewer left: stop polling the router
+            poller.stop()
+            del self.pollers[device_id]
+            logging.info(f"Stopped traffic poller for device {device_id}.")
+
+    def get_stats(self) -> dict:
+        return {
+            "active_pollers": len(self.pollers),
+            "total_subscribers": sum(len(p.subscribers) for p in self.pollers.values()),
+            "devices": {
+                device_id: {"subscribers": len(p.subscribers), "polls": p.poll_count}
+                for device_id, p in self.pollers.items()
+            },
+        }
+
+
+traffic_pollers = TrafficPollerRegistry()
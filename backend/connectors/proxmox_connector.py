@@ -5,6 +5,8 @@ from fastapi import HTTPException
 from sqlalchemy.orm import Session
 import models
 import logging
+from connectors.http_clients import get_http_client
+from connectors.inventory_cache import proxmox_cache
 
 class ProxmoxAPIClient:
     """A client for making authenticated requests to the Proxmox VE API."""
@@ -13,6 +15,7 @@ class ProxmoxAPIClient:
         if not server:
             raise HTTPException(status_code=404, detail="Proxmox server not found.")
         
+        self.server_id = server_id
         self.base_url = f"https://{server.host}:{server.port or 8006}/api2/json"
         
         # Proxmox API token needs to be in the Authorization header.
@@ -22,13 +25,17 @@ class ProxmoxAPIClient:
         self.headers = {
             "Authorization": f"PVEAPIToken={server.api_token_id}={token_secret}"
         }
-        self.client = httpx.AsyncClient(verify=False) # In production, manage certs
+        # Shared per server, so repeated requests reuse warm connections; replaced when the API token changes
+        self.client = get_http_client(f"proxmox:{server_id}", self.base_url, self.headers)
 
     async def get(self, endpoint: str):
-        """Sends an authenticated GET request to the Proxmox API."""
+        """Sends an authenticated GET request to the Proxmox API, served from the inventory cache when fresh."""
+        return await proxmox_cache.get_or_fetch((self.server_id, endpoint), lambda: self._get_uncached(endpoint))
+
+    async def _get_uncached(self, endpoint: str):
         url = f"{self.base_url}{endpoint}" # Proxmox endpoints start with a '/'
         try:
-            response = await self.client.get(url, headers=self.headers)
+            response = await self.client.get(url)
             response.raise_for_status()
             # The actual data is usually inside a 'data' key
             return response.json().get('data')
@@ -43,7 +50,7 @@ class ProxmoxAPIClient:
         """Sends an authenticated POST request (for actions like start/stop)."""
         url = f"{self.base_url}{endpoint}"
         try:
-            response = await self.client.post(url, headers=self.headers, json=data)
+            response = await self.client.post(url, json=data)
             response.raise_for_status()
             return response.json().get('data')
         except httpx.HTTPStatusError as e:
@@ -52,6 +59,10 @@ class ProxmoxAPIClient:
         except httpx.RequestError as e:
             logging.error(f"Could not connect to Proxmox for POST {endpoint}: {e}")
             raise HTTPException(status_code=503, detail=f"Could not connect to Proxmox server: {e}")
+        finally:
+            # Any action may change VM state, so cached reads for this server are dropped
+            proxmox_cache.invalidate(self.server_id)
 
     async def close(self):
-        await self.client.aclose()
+        # The underlying client is shared and closed at application shutdown
+        pass
@@ -1,86 +1,163 @@
 # connectors/vmware_connector.py
 
 import aiohttp
+import asyncio
+import time
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
+from typing import Dict, Optional
 import models
 import logging
+from connectors.inventory_cache import vmware_cache
 
-# A simple in-memory cache for session tokens to avoid logging in for every request
-session_tokens = {}
+# vCenter REST sessions expire after 30 minutes of inactivity by default;
+# refresh a little earlier so requests don't race the expiry.
+TOKEN_TTL_SECONDS = 25 * 60
 
-async def get_vcenter_session_token(db: Session, vcenter_id: int) -> str:
+class VCenterSession:
     """
-    Authenticates with a vCenter server and returns a session token.
-    Uses a simple cache to reuse tokens.
+    One persistent aiohttp session per vCenter. It owns the TCP connector and the
+    API session token, refreshes the token on TTL expiry or a 401, and makes sure
+    only one login runs at a time no matter how many requests are waiting.
     """
-    # In a real-world scenario, you should check token expiration
-    if vcenter_id in session_tokens:
-        return session_tokens[vcenter_id]
+    def __init__(self, vcenter: models.VMwareVCenter):
+        self.name = vcenter.name
+        self.base_url = f"https://{vcenter.host}/rest"
+        # password = decrypt_value(vcenter.password)
+        password = vcenter.password # Placeholder
+        self.auth = aiohttp.BasicAuth(login=vcenter.username, password=password)
+        self.credentials = (vcenter.host, vcenter.username, password)
+        self.token: Optional[str] = None
+        self.token_obtained_at = 0.0
+        self.login_lock = asyncio.Lock()
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    def _get_http_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            # In production, SSL verification should be enabled and managed properly.
+            connector = aiohttp.TCPConnector(ssl=False, limit=20, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    def _token_valid(self) -> bool:
+        return self.token is not None and time.monotonic() - self.token_obtained_at < TOKEN_TTL_SECONDS
+
+    async def get_token(self, stale_token: Optional[str] = None) -> str:
+        """
+        Returns a valid session token, logging in if needed. `stale_token` is the token
+        that just got a 401; it is only replaced if no one else has refreshed it yet.
+        """
+        if self._token_valid() and self.token != stale_token:
+            return self.token
+        async with self.login_lock:
+            # Another request may have logged in while we were waiting for the lock
+            if self._token_valid() and self.token != stale_token:
+                return self.token
+            try:
+                async with self._get_http_session().post(f"{self.base_url}/com/vmware/cis/session", auth=self.auth) as response:
+                    response.raise_for_status()
+                    self.token = (await response.json())['value']
+                    self.token_obtained_at = time.monotonic()
+                    logging.info(f"Successfully obtained session token for vCenter '{self.name}'.")
+                    return self.token
+            except Exception as e:
+                self.token = None
+                logging.error(f"vCenter authentication failed for '{self.name}': {e}")
+                raise HTTPException(status_code=500, detail=f"vCenter authentication failed: {e}")
 
+    async def request(self, method: str, endpoint: str, data: dict = None):
+        url = f"{self.base_url}/{endpoint}"
+        token = await self.get_token()
+        for attempt in range(2):
+            headers = {"vmware-api-session-id": token}
+            async with self._get_http_session().request(method, url, headers=headers, json=data) as response:
+                if response.status == 401 and attempt == 0:
+                    # The token expired server-side; log in again once and retry
+                    token = await self.get_token(stale_token=token)
+                    continue
+                response.raise_for_status()
+                if method == "GET":
+                    return await response.json()
+                if response.content_length and response.content_length > 0:
+                    return await response.json()
+                return {"status": "success"} # For actions that return no content
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+# Managed sessions, one per vCenter
+vcenter_sessions: Dict[int, VCenterSession] = {}
+
+async def get_vcenter_session(db: Session, vcenter_id: int) -> VCenterSession:
     vcenter = db.query(models.VMwareVCenter).filter(models.VMwareVCenter.id == vcenter_id).first()
     if not vcenter:
         raise HTTPException(status_code=404, detail="vCenter server not found.")
 
-    auth_url = f"https://{vcenter.host}/rest/com/vmware/cis/session"
-    # password = decrypt_value(vcenter.password)
-    password = vcenter.password # Placeholder
-    
-    auth = aiohttp.BasicAuth(login=vcenter.username, password=password)
-    
-    # In production, SSL verification should be enabled and managed properly.
-    connector = aiohttp.TCPConnector(ssl=False)
-    async with aiohttp.ClientSession(connector=connector) as session:
-        try:
-            async with session.post(auth_url, auth=auth) as response:
-                response.raise_for_status()
-                token = (await response.json())['value']
-                session_tokens[vcenter_id] = token
-                logging.info(f"Successfully obtained session token for vCenter '{vcenter.name}'.")
-                return token
-        except Exception as e:
-            logging.error(f"vCenter authentication failed for '{vcenter.name}': {e}")
-            raise HTTPException(status_code=500, detail=f"vCenter authentication failed: {e}")
+    session = vcenter_sessions.get(vcenter_id)
+    if session is None or session.credentials != (vcenter.host, vcenter.username, vcenter.password):
+        old_session = session
+        session = VCenterSession(vcenter)
+        vcenter_sessions[vcenter_id] = session
+        if old_session is not None:
+            # Connection settings changed; the old session and token are useless
+            await old_session.close()
+    return session
+
+async def get_vcenter_session_token(db: Session, vcenter_id: int) -> str:
+    """
+    Authenticates with a vCenter server and returns a session token.
+    Tokens are reused until they expire.
+    """
+    session = await get_vcenter_session(db, vcenter_id)
+    return await session.get_token()
+
+async def close_vcenter_sessions():
+    sessions = list(vcenter_sessions.values())
+    vcenter_sessions.clear()
+    for session in sessions:
+        await session.close()
 
 class VMwareAPIClient:
-    """A client for making authenticated requests to the vCenter REST API."""
+    """
+    A client for making authenticated requests to the vCenter REST API. The managed
+    session is looked up on the first request, which runs on the event loop.
+    """
     def __init__(self, db: Session, vcenter_id: int):
         self.db = db
         self.vcenter_id = vcenter_id
-        vcenter = db.query(models.VMwareVCenter).filter(models.VMwareVCenter.id == vcenter_id).first()
-        if not vcenter:
-            raise HTTPException(status_code=404, detail="vCenter server not found.")
-        self.base_url = f"https://{vcenter.host}/rest"
-        self.connector = aiohttp.TCPConnector(ssl=False)
+        self.session: Optional[VCenterSession] = None
+
+    async def _get_session(self) -> VCenterSession:
+        if self.session is None:
+            self.session = await get_vcenter_session(self.db, self.vcenter_id)
+        return self.session
+
+    async def _request(self, method: str, endpoint: str, data: dict = None):
+        session = await self._get_session()
+        return await session.request(method, endpoint, data)
 
     async def get(self, endpoint: str):
-        """Sends an authenticated GET request to the vCenter API."""
-        token = await get_vcenter_session_token(self.db, self.vcenter_id)
-        url = f"{self.base_url}/{endpoint}"
-        headers = {"vmware-api-session-id": token}
-        
-        async with aiohttp.ClientSession(connector=self.connector) as session:
-            try:
-                async with session.get(url, headers=headers) as response:
-                    response.raise_for_status()
-                    return await response.json()
-            except Exception as e:
-                logging.error(f"vCenter API GET request to '{endpoint}' failed: {e}")
-                raise HTTPException(status_code=500, detail=f"vCenter API call failed: {e}")
+        """Sends an authenticated GET request to the vCenter API, served from the inventory cache when fresh."""
+        try:
+            return await vmware_cache.get_or_fetch(
+                (self.vcenter_id, endpoint), lambda: self._request("GET", endpoint)
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            logging.error(f"vCenter API GET request to '{endpoint}' failed: {e}")
+            raise HTTPException(status_code=500, detail=f"vCenter API call failed: {e}")
     
     async def post(self, endpoint: str, data: dict = None):
         """Sends an authenticated POST request to the vCenter API."""
-        token = await get_vcenter_session_token(self.db, self.vcenter_id)
-        url = f"{self.base_url}/{endpoint}"
-        headers = {"vmware-api-session-id": token}
-        
-        async with aiohttp.ClientSession(connector=self.connector) as session:
-            try:
-                async with session.post(url, headers=headers, json=data) as response:
-                    response.raise_for_status()
-                    if response.content_length and response.content_length > 0:
-                        return await response.json()
-                    return {"status": "success"} # For actions that return no content
-            except Exception as e:
-                logging.error(f"vCenter API POST request to '{endpoint}' failed: {e}")
-                raise HTTPException(status_code=500, detail=f"vCenter API call failed: {e}")
+        try:
+            return await self._request("POST", endpoint, data)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logging.error(f"vCenter API POST request to '{endpoint}' failed: {e}")
+            raise HTTPException(status_code=500, detail=f"vCenter API call failed: {e}")
+        finally:
+            # Any action may change VM state, so cached reads for this vCenter are dropped
+            vmware_cache.invalidate(self.vcenter_id)
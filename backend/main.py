@@ -1,5 +1,17 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from connectors import mikrotik_async
+from connectors.mikrotik_connector import pool_manager
+from connectors.cisco_connector import session_cache as cisco_session_cache
+from connectors.http_clients import close_all_clients
+from connectors.vmware_connector import close_vcenter_sessions
+from connectors.docker_connector import close_docker_clients
+from connectors.inventory_cache import get_inventory_cache_stats
+import auth_backends
+import chat_attachments
+from chat_writer import chat_writer
+from backplane import backplane
+from routers import chat, discovery
 # In a full project, you would import all your API routers here
 # from routers import devices, users, etc.
 
@@ -23,6 +35,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Response headers the cross-origin frontends need to read
+    expose_headers=["X-Next-Replies-Cursor"],
 )
 
 # --- Include API Routers ---
@@ -35,6 +49,43 @@ def health_check():
     """Provides a simple health check to confirm the API is running."""
     return {"status": "ok", "message": "Backend API is alive!"}
 
+@app.get("/api/health/inventory-cache", tags=["System"])
+def inventory_cache_stats():
+    """Reports hit ratios of the hypervisor inventory caches."""
+    return get_inventory_cache_stats()
+
+# --- Lifespan Hooks ---
+@app.on_event("startup")
+async def start_chat_writer():
+    """Claims a unique worker number for chat message ids; startup fails without one."""
+    await chat_writer.start()
+
+@app.on_event("startup")
+async def subscribe_chat():
+    """Receives chat messages from startup on, so every worker keeps its recent-message windows current."""
+    await chat.manager.start()
+
+@app.on_event("startup")
+async def start_discovery():
+    """Joins the election of the worker that coordinates discovery scans."""
+    await discovery.manager.start()
+
+@app.on_event("shutdown")
+async def shutdown_connectors():
+    """Flushes pending chat messages and releases worker threads and device sessions."""
+    await chat_writer.stop()
+    await chat_writer.release_lease()
+    await discovery.coordinator.stop()
+    mikrotik_async.shutdown()
+    pool_manager.close_all()
+    cisco_session_cache.close_all()
+    await close_all_clients()
+    await close_vcenter_sessions()
+    close_docker_clients()
+    auth_backends.shutdown()
+    chat_attachments.shutdown()
+    await backplane.close()
+
 # Note: The StaticFiles mounts are removed as Next.js will handle the frontend.
 # backend/main.py
 # from fastapi_kerberos import KerberosMiddleware, KerberosConfig
@@ -22,5 +22,26 @@ class User(Base):
     auth_source = Column(String(50), default='local', nullable=False) 
     # شناسه منحصر به فرد کاربر در سیستم خارجی (مثلاً objectGUID در AD)
     external_id = Column(String(255), nullable=True, index=True) 
+    # Incremented to revoke every token issued to this user so far
+    token_version = Column(Integer, default=0, nullable=False)
 
     role = relationship("Role", back_populates="users", lazy="joined")
+
+class BlacklistRevision(Base):
+    # Bumped when a category's entries are rewritten in place; part of the export signature
+    __tablename__ = 'blacklist_revisions'
+
+    category_id = Column(Integer, primary_key=True)
+    revision = Column(Integer, default=0, nullable=False)
+
+class ChatAttachment(Base):
+    # One row per (file content, room) it was uploaded to; grants the room's members access
+    __tablename__ = 'chat_attachments'
+
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), nullable=False)
+    room_id = Column(Integer, nullable=False, index=True)
+    uploaded_by_user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (UniqueConstraint('sha256', 'room_id', name='uq_chat_attachments_object_room'),)
@@ -4,17 +4,15 @@ from datetime import timedelta
 import ldap # برای LDAP Bind
 
 # ... (سایر import ها)
-from security import verify_password, create_access_token
+import models, database
+from security import create_access_token
+from auth_backends import verify_password_async, ldap_authenticate, LDAPThrottled
 # from kerberos_auth import kerberos_auth # یک dependency جدید برای Kerberos
 
 router = APIRouter(
     tags=["Authentication"]
 )
 
-# فرض می‌کنیم تنظیمات از دیتابیس خوانده شده‌اند
-LDAP_SERVER = "ldap://dc.mycorp.local"
-LDAP_BASE_DN = "ou=Users,dc=mycorp,dc=local"
-
 @router.post("/token")
 async def login_for_access_token(
     form_data: dict, # دیگر از OAuth2PasswordRequestForm استفاده نمی‌کنیم
@@ -31,17 +29,15 @@ async def login_for_access_token(
     
     if auth_type == "local":
         user = db.query(models.User).filter(models.User.username == username, models.User.auth_source == 'local').first()
-        if not user or not verify_password(password, user.hashed_password):
+        if not user or not await verify_password_async(password, user.hashed_password):
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username or password")
 
     elif auth_type == "ldap":
         try:
             # تلاش برای اتصال (Bind) به سرور LDAP با اطلاعات کاربر
-            con = ldap.initialize(LDAP_SERVER)
-            con.protocol_version = ldap.VERSION3
-            # ساختن distinguished name (DN) کاربر
-            user_dn = f"cn={username},{LDAP_BASE_DN}"
-            con.simple_bind_s(user_dn, password)
+            # Recent results are answered from cache; otherwise the bind runs on a
+            # pooled connection in the auth worker pool
+            await ldap_authenticate(username, password)
             
             # اگر bind موفق بود، کاربر را در دیتابیس خودمان پیدا یا ایجاد می‌کنیم
             user = db.query(models.User).filter(models.User.username == username, models.User.auth_source == 'ldap').first()
@@ -53,7 +49,10 @@ async def login_for_access_token(
                 # user = new_user
                 raise HTTPException(status_code=404, detail="User not found in local database. Please sync users first.")
 
-            con.unbind_s()
+        except HTTPException:
+            raise
+        except LDAPThrottled:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many failed login attempts. Try again later.")
         except ldap.INVALID_CREDENTIALS:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect LDAP username or password")
         except Exception as e:
@@ -63,7 +62,7 @@ async def login_for_access_token(
         raise HTTPException(status_code=401, detail="Authentication failed.")
 
     # صدور توکن JWT
-    access_token = create_access_token(data={"sub": user.username})
+    access_token = create_access_token(data={"sub": user.username}, user=user)
     return {"access_token": access_token, "token_type": "bearer"}
 
 # Endpoint برای Kerberos SSO
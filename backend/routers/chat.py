@@ -1,44 +1,337 @@
 # backend/routers/chat.py
 
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, Query, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, Query, HTTPException, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional, Tuple
+from collections import deque
+from datetime import datetime
+from pydantic import BaseModel
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+import asyncio
+import base64
+import bisect
 import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import quote
 
 import models, schemas, database
 from security import get_current_user_from_token, get_user_from_token_ws
 from dependencies import require_permission
-import shutil # For saving uploaded files
+from chat_writer import chat_writer, generate_message_id
+from backplane import backplane
+from config import settings
+import chat_attachments
 
 router = APIRouter(
     prefix="/api/chat",
     tags=["Chat"]
 )
 
+# --- Recent Message Window ---
+# Each room keeps its newest messages in memory, in (timestamp, id) order. The
+# window is filled from the backplane, so every worker sees every new message,
+# and is seeded from the database the first time the room's history is read.
+# Opening a room then serves the latest page without a query.
+
+RECENT_MESSAGES_PER_ROOM = 200
+# Messages reach the database up to a batch delay after they are broadcast, so
+# a window seeded right after this worker subscribed could miss one; until this
+# long after subscribing, seeding is repeated instead of trusted.
+SEED_SAFETY_SECONDS = 5
+
+def _message_key(message: dict) -> Tuple[datetime, int]:
+    return message["timestamp"], message["id"]
+
+class RecentMessages:
+    """
+    Bounded, sorted window of a room's newest messages. It is written on the event
+    loop and read by history requests in the threadpool, hence the lock.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.messages: List[dict] = []
+        self.keys: List[Tuple[datetime, int]] = []
+        self.seeded = False
+        # True while the window holds the room's entire history
+        self.complete = False
+
+    def add(self, message: dict):
+        with self.lock:
+            self._add(message)
+
+    def _add(self, message: dict):
+        key = _message_key(message)
+        position = bisect.bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            return # Already there (seeded from the database)
+        # Usually an append; workers' clocks may deliver slightly out of order
+        self.keys.insert(position, key)
+        self.messages.insert(position, message)
+        if len(self.messages) > RECENT_MESSAGES_PER_ROOM:
+            del self.keys[0], self.messages[0]
+            self.complete = False
+
+    def seed(self, rows: List[dict], complete: bool, trusted: bool):
+        with self.lock:
+            # Set first: adding past the bound clears it again
+            self.complete = complete
+            for row in rows:
+                self._add(row)
+            self.seeded = trusted
+
+    def page(self, before: Optional[tuple], after: Optional[tuple], limit: int):
+        """
+        Returns (items, has_older, has_newer) when the window alone can answer the
+        request, or None when the database is needed.
+        """
+        with self.lock:
+            return self._page(before, after, limit)
+
+    def _page(self, before: Optional[tuple], after: Optional[tuple], limit: int):
+        if not self.seeded:
+            return None
+        if after is not None:
+            # The window is the newest part of the history: if it reaches back to
+            # the cursor, everything newer than the cursor is in it
+            if not self.complete and (not self.keys or after < self.keys[0]):
+                return None
+            start = bisect.bisect_right(self.keys, after)
+            items = self.messages[start:start + limit]
+            return items, True, start + limit < len(self.messages)
+        end = bisect.bisect_left(self.keys, before) if before is not None else len(self.keys)
+        if end >= limit:
+            return self.messages[end - limit:end], end > limit or not self.complete, before is not None
+        if self.complete:
+            return self.messages[:end], False, before is not None
+        return None
+
+    def in_range(self, before: Optional[tuple], after: Optional[tuple]) -> List[dict]:
+        with self.lock:
+            return self._in_range(before, after)
+
+    def _in_range(self, before: Optional[tuple], after: Optional[tuple]) -> List[dict]:
+        start = bisect.bisect_right(self.keys, after) if after is not None else 0
+        end = bisect.bisect_left(self.keys, before) if before is not None else len(self.keys)
+        return self.messages[start:end]
+
+# room_id -> window
+recent_messages: dict[int, RecentMessages] = {}
+# History requests in the threadpool and the event loop both create windows
+_recent_lock = threading.Lock()
+
+def _get_recent(room_id: int) -> RecentMessages:
+    with _recent_lock:
+        recent = recent_messages.get(room_id)
+        if recent is None:
+            recent = recent_messages[room_id] = RecentMessages()
+        return recent
+
 # --- WebSocket Connection Manager ---
+
+# Messages queued for one client before it counts as a slow consumer
+CLIENT_QUEUE_SIZE = 100
+# A client that is still behind after this many resyncs in a row is disconnected
+MAX_RESYNCS = 3
+SEND_TIMEOUT_SECONDS = 10
+# Delivery latencies kept per room for the percentiles in get_stats()
+LATENCY_SAMPLES = 1000
+# Sent instead of the messages a slow client missed; it should reload the room history
+RESYNC_MESSAGE = json.dumps({"type": "resync"})
+# Backplane channel carrying every room's messages to every worker
+CHAT_CHANNEL = "chat"
+
+class ChatClient:
+    """One socket in a room, with its own bounded outbound queue and sender task."""
+    def __init__(self, room_id: int, websocket: WebSocket):
+        self.room_id = room_id
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.resyncs = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def enqueue(self, text: str, broadcast_at: float) -> Optional[bool]:
+        """Queues a serialized message. Returns True if the client had to be resynced and None if it should be dropped."""
+        try:
+            self.queue.put_nowait((text, broadcast_at))
+            return False
+        except asyncio.QueueFull:
+            pass
+        self.resyncs += 1
+        if self.resyncs > MAX_RESYNCS:
+            return None
+        # Throw away the backlog; the client fetches what it missed from the history API
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait((RESYNC_MESSAGE, broadcast_at))
+        return True
+
+class RoomStats:
+    def __init__(self):
+        self.messages = 0
+        self.deliveries = 0
+        self.resyncs = 0
+        self.dropped_clients = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def to_dict(self) -> dict:
+        samples = sorted(self.latencies)
+        def percentile(p):
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 2) if samples else None
+        return {
+            "messages": self.messages,
+            "deliveries": self.deliveries,
+            "resyncs": self.resyncs,
+            "dropped_clients": self.dropped_clients,
+            "fanout_latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "max": percentile(1.0)},
+        }
+
 class ChatConnectionManager:
+    """
+    Tracks the sockets of each room. A broadcast serializes the message once and
+    publishes it on the backplane; every worker then puts it on the outbound queue
+    of its own clients in that room without waiting. Each client has its own
+    sender task, so one slow socket never delays the rest of the room.
+    """
     def __init__(self):
-        self.active_connections: dict[int, List[WebSocket]] = {}
+        self.active_connections: dict[int, dict[WebSocket, ChatClient]] = {}
+        self.room_stats: dict[int, RoomStats] = {}
+        self.subscribed = False
+        self.subscribed_at: Optional[float] = None
+        # Close handshakes of dropped clients; referenced so they aren't garbage collected mid-close
+        self.closing: set[asyncio.Task] = set()
+
+    async def start(self):
+        """Subscribes to the chat channel; called at startup so every worker's windows stay current."""
+        if not self.subscribed:
+            self.subscribed = True
+            await backplane.subscribe(CHAT_CHANNEL, self._on_backplane_message)
+            self.subscribed_at = time.monotonic()
 
     async def connect(self, room_id: int, websocket: WebSocket):
+        await self.start()
         await websocket.accept()
-        if room_id not in self.active_connections:
-            self.active_connections[room_id] = []
-        self.active_connections[room_id].append(websocket)
+        client = ChatClient(room_id, websocket)
+        self.active_connections.setdefault(room_id, {})[websocket] = client
+        self.room_stats.setdefault(room_id, RoomStats())
+        client.task = asyncio.create_task(self._send_loop(client))
 
     def disconnect(self, room_id: int, websocket: WebSocket):
-        if room_id in self.active_connections:
-            self.active_connections[room_id].remove(websocket)
+        clients = self.active_connections.get(room_id)
+        if not clients or websocket not in clients:
+            return
+        client = clients.pop(websocket)
+        if not clients:
+            del self.active_connections[room_id]
+        if client.task and client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    async def _send_loop(self, client: ChatClient):
+        stats = self.room_stats[client.room_id]
+        try:
+            while True:
+                text, broadcast_at = await client.queue.get()
+                await asyncio.wait_for(client.websocket.send_text(text), SEND_TIMEOUT_SECONDS)
+                stats.deliveries += 1
+                stats.latencies.append(time.monotonic() - broadcast_at)
+                if client.queue.empty():
+                    client.resyncs = 0
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Broken or stalled socket: prune it so later broadcasts skip it
+            logging.info(f"Chat: dropping connection in room {client.room_id}: {e!r}")
+            self.disconnect(client.room_id, client.websocket)
+            await self._close(client.websocket, 1011, "Send failed")
+
+    async def _close(self, websocket: WebSocket, code: int, reason: str):
+        try:
+            await websocket.close(code=code, reason=reason)
+        except Exception:
+            pass # Already closed
+
+    def _drop_slow_client(self, client: ChatClient):
+        self.room_stats[client.room_id].dropped_clients += 1
+        logging.warning(f"Chat: disconnecting slow client in room {client.room_id} after {MAX_RESYNCS} resyncs.")
+        self.disconnect(client.room_id, client.websocket)
+        task = asyncio.create_task(self._close(client.websocket, 1013, "Too far behind, reconnect"))
+        self.closing.add(task)
+        task.add_done_callback(self.closing.discard)
 
-    async def broadcast_to_room(self, room_id: int, message: dict):
-        if room_id in self.active_connections:
-            for connection in self.active_connections[room_id]:
-                await connection.send_json(message)
+    async def broadcast_to_room(self, room_id: int, message: dict, history_row: Optional[dict] = None):
+        """Sends a message to the room on every worker; `history_row` also adds it to the recent-message windows."""
+        await self.start()
+        envelope = {"room_id": room_id, "text": json.dumps(message)} # Serialized once; workers forward the text as is
+        if history_row is not None:
+            envelope["row"] = {**history_row, "timestamp": history_row["timestamp"].isoformat()}
+        await backplane.publish(CHAT_CHANNEL, json.dumps(envelope))
+
+    async def _on_backplane_message(self, payload: str):
+        envelope = json.loads(payload)
+        row = envelope.get("row")
+        if row is not None:
+            _get_recent(envelope["room_id"]).add({**row, "timestamp": datetime.fromisoformat(row["timestamp"])})
+        self._deliver_local(envelope["room_id"], envelope["text"])
+
+    def _deliver_local(self, room_id: int, text: str):
+        clients = self.active_connections.get(room_id)
+        if not clients:
+            return
+        stats = self.room_stats[room_id]
+        stats.messages += 1
+        broadcast_at = time.monotonic()
+        for client in list(clients.values()):
+            resynced = client.enqueue(text, broadcast_at)
+            if resynced is None:
+                self._drop_slow_client(client)
+            elif resynced:
+                stats.resyncs += 1
+
+    def send_to_client(self, room_id: int, websocket: WebSocket, message: dict):
+        """Queues a message for one client; only its sender task writes to the socket."""
+        client = self.active_connections.get(room_id, {}).get(websocket)
+        if client and client.enqueue(json.dumps(message), time.monotonic()) is None:
+            self._drop_slow_client(client)
+
+    def get_stats(self) -> dict:
+        return {
+            "rooms": len(self.active_connections),
+            "connections": sum(len(clients) for clients in self.active_connections.values()),
+            "room_stats": {
+                room_id: {"connections": len(self.active_connections.get(room_id, {})), **stats.to_dict()}
+                for room_id, stats in self.room_stats.items()
+            },
+        }
 
 manager = ChatConnectionManager()
 
 # --- WebSocket Endpoint for Real-time Messaging ---
 
+# Checked before a message is broadcast or queued for the database
+MESSAGE_TYPES = ("text", "file", "image", "location")
+MAX_MESSAGE_LENGTH = 4000
+
+def _validate_message(data) -> Optional[str]:
+    """Returns why a received message is unacceptable, or None."""
+    if not isinstance(data, dict):
+        return "Message must be a JSON object."
+    if data.get('type', 'text') not in MESSAGE_TYPES:
+        return f"Message type must be one of: {', '.join(MESSAGE_TYPES)}."
+    content = data.get('content')
+    if not isinstance(content, str) or not content.strip():
+        return "Message content must be a non-empty string."
+    if len(content) > MAX_MESSAGE_LENGTH:
+        return f"Messages are limited to {MAX_MESSAGE_LENGTH} characters."
+    return None
+
+def _now_ms() -> datetime:
+    now = datetime.utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
 @router.websocket("/ws/{room_id}")
 async def websocket_chat_endpoint(
     websocket: WebSocket, 
@@ -64,35 +357,50 @@ async def websocket_chat_endpoint(
     try:
         while True:
             data = await websocket.receive_json()
+            error = _validate_message(data)
+            if error:
+                manager.send_to_client(room_id, websocket, {"type": "error", "detail": error})
+                continue
             
-            # Save message to database
-            new_message = models.ChatMessage(
-                room_id=room_id,
-                user_id=user.id,
-                message_type=data.get('type', 'text'),
-                text_content=data.get('content')
+            # The id and timestamp are assigned here, so the message can be
+            # broadcast before it reaches the database
+            new_message = {
+                "id": generate_message_id(),
+                "room_id": room_id,
+                "user_id": user.id,
+                "message_type": data.get('type', 'text'),
+                "text_content": data.get('content'),
+                # Millisecond precision, as stored, so history cursors compare equal
+                "timestamp": _now_ms(),
                 # ... handle other message types like file, location ...
-            )
-            db.add(new_message)
-            db.commit()
-            db.refresh(new_message)
+            }
             
             # Broadcast message to all clients in the room
             message_to_broadcast = {
-                "id": new_message.id,
+                "id": new_message["id"],
                 "user": user.username,
-                "type": new_message.message_type,
-                "content": new_message.text_content,
-                "timestamp": new_message.timestamp.isoformat()
+                "type": new_message["message_type"],
+                "content": new_message["text_content"],
+                "timestamp": new_message["timestamp"].isoformat()
             }
-            await manager.broadcast_to_room(room_id, message_to_broadcast)
+            await manager.broadcast_to_room(room_id, message_to_broadcast, history_row=new_message)
+
+            # Save message to database (batched by the write-behind writer)
+            await chat_writer.submit(new_message)
 
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(room_id, websocket)
 
 
 # --- REST API Endpoints for Chat Management ---
 
+@router.get("/stats", dependencies=[Depends(require_permission("chat:manage:rooms"))])
+def get_chat_stats():
+    """Reports connections, slow-consumer resyncs and fan-out latency per room."""
+    return manager.get_stats()
+
 @router.get("/my-rooms", dependencies=[Depends(get_current_user_from_token)])
 def get_my_chat_rooms(current_user: models.User = Depends(get_current_user_from_token), db: Session = Depends(database.get_db)):
     """Gets the list of chat rooms the current user is a member of."""
@@ -100,24 +408,251 @@ def get_my_chat_rooms(current_user: models.User = Depends(get_current_user_from_
     rooms = [p.room for p in participations]
     return rooms
 
-@router.get("/rooms/{room_id}/messages", dependencies=[Depends(get_current_user_from_token)])
-def get_chat_history(room_id: int, current_user: models.User = Depends(get_current_user_from_token), db: Session = Depends(database.get_db)):
-    """Gets the message history for a specific room."""
-    # ... (Security check to ensure user is a participant) ...
-    messages = db.query(models.ChatMessage).filter(models.ChatMessage.room_id == room_id).order_by(models.ChatMessage.timestamp.asc()).all()
-    return messages
-
-@router.post("/upload", dependencies=[Depends(get_current_user_from_token)])
-async def upload_chat_file(file: UploadFile = File(...)):
-    """Handles file uploads for chat attachments."""
-    # Define a safe path to store files
-    file_path = f"uploads/chat/{file.filename}"
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+# --- Chat History ---
+# Pages are in chronological order and addressed by (timestamp, id) cursors:
+# no cursor returns the newest page, `before` pages back in time and `after`
+# fetches what came since (e.g. after a resync).
+
+DEFAULT_HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+
+class ChatHistoryPage(BaseModel):
+    items: List[dict]
+    # Pass as `before` to load older messages; None when there are none
+    older_cursor: Optional[str] = None
+    # Pass as `after` to load newer messages; None when this is the newest page
+    newer_cursor: Optional[str] = None
+
+def _encode_cursor(message: dict) -> str:
+    raw = json.dumps([message["timestamp"].isoformat(), message["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        timestamp, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _message_to_dict(message: models.ChatMessage) -> dict:
+    return {
+        "id": message.id,
+        "room_id": message.room_id,
+        "user_id": message.user_id,
+        "message_type": message.message_type,
+        "text_content": message.text_content,
+        "timestamp": message.timestamp,
+    }
+
+def _query_history(db: Session, room_id: int, before: Optional[tuple], after: Optional[tuple], limit: int) -> List[dict]:
+    """Up to limit + 1 messages next to the cursor, in chronological order."""
+    query = db.query(models.ChatMessage).filter(models.ChatMessage.room_id == room_id)
+    if before is not None:
+        query = query.filter(or_(
+            models.ChatMessage.timestamp < before[0],
+            and_(models.ChatMessage.timestamp == before[0], models.ChatMessage.id < before[1])
+        ))
+    if after is not None:
+        query = query.filter(or_(
+            models.ChatMessage.timestamp > after[0],
+            and_(models.ChatMessage.timestamp == after[0], models.ChatMessage.id > after[1])
+        ))
+        rows = query.order_by(models.ChatMessage.timestamp.asc(), models.ChatMessage.id.asc()).limit(limit + 1).all()
+    else:
+        rows = query.order_by(models.ChatMessage.timestamp.desc(), models.ChatMessage.id.desc()).limit(limit + 1).all()
+        rows.reverse()
+    return [_message_to_dict(row) for row in rows]
+
+def _seed_recent(db: Session, room_id: int, recent: RecentMessages):
+    # Only trusted once this worker has been receiving the room's messages for a while
+    rows = _query_history(db, room_id, None, None, RECENT_MESSAGES_PER_ROOM)
+    trusted = manager.subscribed_at is not None and time.monotonic() - manager.subscribed_at > SEED_SAFETY_SECONDS
+    recent.seed(rows, complete=len(rows) <= RECENT_MESSAGES_PER_ROOM, trusted=trusted)
+
+@router.get("/rooms/{room_id}/messages", response_model=ChatHistoryPage)
+def get_chat_history(
+    room_id: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_HISTORY_PAGE_SIZE, ge=1, le=MAX_HISTORY_PAGE_SIZE),
+    current_user: models.User = Depends(get_current_user_from_token),
+    db: Session = Depends(database.get_db)
+):
+    """Gets one page of the message history for a specific room."""
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'after', not both.")
+    participant = db.query(models.ChatParticipant.id).filter(
+        models.ChatParticipant.room_id == room_id,
+        models.ChatParticipant.user_id == current_user.id
+    ).first()
+    if not participant:
+        raise HTTPException(status_code=403, detail="Not a member of this room")
+
+    before_key = _decode_cursor(before) if before else None
+    after_key = _decode_cursor(after) if after else None
+
+    recent = None
+    page = None
+    if manager.subscribed_at is not None:
+        recent = _get_recent(room_id)
+        if not recent.seeded:
+            _seed_recent(db, room_id, recent)
+        page = recent.page(before_key, after_key, limit)
+    # Otherwise this worker isn't receiving new messages yet, and a window would go stale
+    if page is not None:
+        items, has_older, has_newer = page
+    else:
+        # Recent messages may not have been written yet, so the window fills in what the database lacks
+        rows = {row["id"]: row for row in _query_history(db, room_id, before_key, after_key, limit)}
+        for message in recent.in_range(before_key, after_key) if recent else []:
+            rows.setdefault(message["id"], message)
+        merged = sorted(rows.values(), key=_message_key)
+        if after_key is not None:
+            items, has_older, has_newer = merged[:limit], True, len(merged) > limit
+        else:
+            items, has_older, has_newer = merged[-limit:], len(merged) > limit, before_key is not None
+
+    return ChatHistoryPage(
+        items=items,
+        older_cursor=_encode_cursor(items[0]) if items and has_older else None,
+        newer_cursor=_encode_cursor(items[-1]) if items and has_newer else None
+    )
+
+# --- Attachments ---
+
+def _ensure_participant(db: Session, user: models.User, room_id: int):
+    participant = db.query(models.ChatParticipant.id).filter(
+        models.ChatParticipant.room_id == room_id,
+        models.ChatParticipant.user_id == user.id
+    ).first()
+    if not participant:
+        raise HTTPException(status_code=403, detail="Not a member of this room")
+
+def _record_attachment(db: Session, digest: str, room_id: int, user_id: int):
+    exists = db.query(models.ChatAttachment.id).filter(
+        models.ChatAttachment.sha256 == digest,
+        models.ChatAttachment.room_id == room_id
+    ).first()
+    if exists:
+        return
+    db.add(models.ChatAttachment(sha256=digest, room_id=room_id, uploaded_by_user_id=user_id))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback() # Recorded by a concurrent upload of the same content
+
+@router.post("/upload")
+async def upload_chat_file(
+    request: Request,
+    room_id: int,
+    filename: str = Query(..., min_length=1, max_length=255),
+    current_user: models.User = Depends(get_current_user_from_token),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Handles file uploads for chat attachments. The request body is the raw file,
+    which is streamed to disk and stored once per distinct content. The upload is
+    recorded against `room_id`, whose members can then read the file.
+    """
+    _ensure_participant(db, current_user, room_id)
+    declared_size = request.headers.get("content-length")
+    if declared_size and declared_size.isdigit() and int(declared_size) > chat_attachments.MAX_ATTACHMENT_BYTES:
+        raise HTTPException(status_code=413, detail=f"Attachments are limited to {settings.CHAT_MAX_ATTACHMENT_MB} MB.")
+
+    digest, size, _ = await chat_attachments.store_stream(request.stream())
+    _record_attachment(db, digest, room_id, current_user.id)
+    file_name = os.path.basename(filename)
+    has_thumbnail = chat_attachments.schedule_thumbnail(digest, chat_attachments.guess_media_type(file_name))
     
     # Return the URL that can be used to access the file
     # This URL will be sent in a WebSocket message of type 'file' or 'image'
-    return {"file_url": f"/files/chat/{file.filename}", "file_name": file.filename, "file_size_kb": round(file.size / 1024)}
+    return {
+        "file_url": f"/api/chat/files/{digest}/{quote(file_name)}",
+        "file_name": file_name,
+        "file_size_kb": round(size / 1024),
+        "sha256": digest,
+        # May answer 404 for a moment while the thumbnail is being rendered
+        "thumbnail_url": f"/api/chat/thumbnails/{digest}" if has_thumbnail else None
+    }
+
+def _read_file_range(path: str, start: int, end: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chat_attachments.WRITE_CHUNK_BYTES, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def _ensure_attachment_access(db: Session, user: models.User, digest: str):
+    """An attachment may be read by members of any room it was uploaded to."""
+    allowed = db.query(models.ChatAttachment.id).join(
+        models.ChatParticipant,
+        and_(
+            models.ChatParticipant.room_id == models.ChatAttachment.room_id,
+            models.ChatParticipant.user_id == user.id
+        )
+    ).filter(models.ChatAttachment.sha256 == chat_attachments.object_digest(digest)).first()
+    if not allowed:
+        # 404 rather than 403, so digests can't be probed
+        raise HTTPException(status_code=404, detail="File not found")
+
+@router.get("/files/{digest}/{filename}")
+def download_chat_file(
+    digest: str,
+    filename: str,
+    request: Request,
+    current_user: models.User = Depends(get_current_user_from_token),
+    db: Session = Depends(database.get_db)
+):
+    """Serves an attachment, with support for range requests (resumable downloads, media seeking)."""
+    _ensure_attachment_access(db, current_user, digest)
+    path = chat_attachments.object_path(digest)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    media_type = chat_attachments.guess_media_type(filename)
+    headers = {
+        "Content-Disposition": f"inline; filename*=UTF-8''{quote(filename)}",
+        # Content-addressed: the bytes behind this URL never change
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "ETag": f'"{digest}"',
+        "Accept-Ranges": "bytes",
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+
+    if settings.CHAT_FILES_ACCEL_PREFIX:
+        # Access was checked above; nginx then sends the file itself (sendfile, ranges included)
+        accel_path = settings.CHAT_FILES_ACCEL_PREFIX.rstrip("/") + "/" + os.path.relpath(path, chat_attachments.OBJECTS_DIR)
+        return Response(media_type=media_type, headers={**headers, "X-Accel-Redirect": accel_path})
+
+    size = os.path.getsize(path)
+    byte_range = chat_attachments.parse_range(request.headers.get("range"), size)
+    if byte_range is None:
+        # FileResponse hands the path to the server when it supports zero-copy sends
+        return FileResponse(path, media_type=media_type, headers=headers)
+    start, end = byte_range
+    return StreamingResponse(
+        _read_file_range(path, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers={**headers, "Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(end - start + 1)}
+    )
+
+@router.get("/thumbnails/{digest}")
+def get_chat_thumbnail(
+    digest: str,
+    current_user: models.User = Depends(get_current_user_from_token),
+    db: Session = Depends(database.get_db)
+):
+    _ensure_attachment_access(db, current_user, digest)
+    path = chat_attachments.thumbnail_path(digest)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Thumbnail not available")
+    return FileResponse(path, media_type="image/jpeg", headers={"Cache-Control": "private, max-age=31536000, immutable"})
 
 # --- Admin Endpoints for Room Management ---
 
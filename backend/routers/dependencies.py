@@ -3,17 +3,70 @@
 
 from fastapi import Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from security import get_current_user_from_token # Assumes this function returns the full User object
+from typing import Dict, FrozenSet, Optional, Tuple
+import threading
+import time
+from security import get_current_user_from_token # Returns the User, or a TokenUser with the same attributes
 import models
 import database
 
+# --- Compiled per-role permission sets ---
+# Each worker process keeps its own copy. Changes made through the roles API are
+# invalidated immediately in that worker; other workers pick them up within the TTL.
+PERMISSION_CACHE_TTL_SECONDS = 300
+
+SUPER_ADMIN_ROLE = "Super Admin"
+
+# role_id -> (expires_at, permission names, is Super Admin)
+_role_permissions: Dict[int, Tuple[float, FrozenSet[str], bool]] = {}
+_role_permissions_lock = threading.Lock()
+
+def _get_role_entry(db: Session, role_id: int) -> Tuple[FrozenSet[str], bool]:
+    cached = _role_permissions.get(role_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1], cached[2]
+
+    role_name = db.query(models.Role.name).filter(models.Role.id == role_id).scalar()
+    rows = db.query(models.Permission.name).join(
+        models.RolePermission, models.RolePermission.permission_id == models.Permission.id
+    ).filter(models.RolePermission.role_id == role_id).all()
+    permissions = frozenset(row[0] for row in rows)
+    is_super_admin = role_name == SUPER_ADMIN_ROLE
+    with _role_permissions_lock:
+        _role_permissions[role_id] = (time.monotonic() + PERMISSION_CACHE_TTL_SECONDS, permissions, is_super_admin)
+    return permissions, is_super_admin
+
+def get_role_permissions(db: Session, role_id: Optional[int]) -> FrozenSet[str]:
+    """Returns the set of permission names granted to a role, from cache when possible."""
+    if role_id is None:
+        return frozenset()
+    return _get_role_entry(db, role_id)[0]
+
+def invalidate_role_permissions(role_id: Optional[int] = None):
+    """Drops the cached permissions of one role, or of every role."""
+    with _role_permissions_lock:
+        if role_id is None:
+            _role_permissions.clear()
+        else:
+            _role_permissions.pop(role_id, None)
+
+def user_has_permission(db: Session, user: models.User, permission: str) -> bool:
+    # Only role_id is used, so token-only users never need their ORM row loaded here;
+    # a TokenUser's role_id comes from the token state cache, not from the token
+    if user.role_id is None:
+        return False
+    permissions, is_super_admin = _get_role_entry(db, user.role_id)
+    # Super Admins have god mode :)
+    return is_super_admin or permission in permissions
+
 def require_permission(required_permission: str):
     """
     A FastAPI dependency that checks if the current user has the required permission.
     This is the core of the RBAC enforcement.
     """
     async def permission_checker(
-        current_user: models.User = Depends(get_current_user_from_token)
+        current_user: models.User = Depends(get_current_user_from_token),
+        db: Session = Depends(database.get_db)
     ):
         if not current_user or not current_user.is_active:
             raise HTTPException(
@@ -21,14 +74,7 @@ def require_permission(required_permission: str):
                 detail="Not authenticated or inactive user",
             )
         
-        # Super Admins have god mode :)
-        if current_user.role and current_user.role.name == "Super Admin":
-            return current_user # Grant access immediately
-
-        # Extract permission names from the user's role
-        user_permissions = {p.permission.name for p in current_user.role.permissions}
-
-        if required_permission not in user_permissions:
+        if not user_has_permission(db, current_user, required_permission):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Permission denied. Requires: '{required_permission}'",
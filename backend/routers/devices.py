@@ -3,6 +3,8 @@ from sqlalchemy.orm import Session
 from typing import List
 import models, schemas, database
 from security import get_current_user # Dependency for checking login
+from connectors.mikrotik_connector import pool_manager
+from connectors.cisco_connector import session_cache as cisco_session_cache
 
 router = APIRouter(
     prefix="/api/devices",
@@ -43,4 +45,6 @@ def delete_device(device_id: int, db: Session = Depends(database.get_db)):
         raise HTTPException(status_code=404, detail="Device not found")
     db.delete(db_device)
     db.commit()
+    pool_manager.invalidate(device_id)
+    cisco_session_cache.invalidate(device_id)
     return
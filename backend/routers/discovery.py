@@ -1,12 +1,21 @@
 # backend/routers/discovery.py
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from typing import Dict, List
+from collections import deque
+from typing import Deque, Dict, List, Optional
+import asyncio
+import hmac
+import ipaddress
 import json
+import logging
+import time
+import uuid
 import models, schemas, database
 from security import get_current_user_from_token
 from dependencies import require_permission
+from backplane import backplane
 
 router = APIRouter(
     prefix="/api/discovery",
@@ -14,71 +23,537 @@ router = APIRouter(
     dependencies=[Depends(require_permission("discovery:run"))] # A new permission
 )
 
+# Backplane channels: agent results for the admin frontends, scan requests and
+# agent events for the coordinating worker, and commands for the agents, which
+# the worker holding each agent's websocket passes on
+RESULTS_CHANNEL = "discovery:results"
+COMMANDS_CHANNEL = "discovery:commands"
+AGENT_EVENTS_CHANNEL = "discovery:agent_events"
+AGENT_COMMANDS_CHANNEL = "discovery:agent_commands"
+
+# Exactly one worker, the holder of this backplane lease, coordinates all scans,
+# driving the agents connected to every worker. If it dies, another worker takes
+# over once the lease expires; scans it was running are lost.
+COORDINATOR_LEASE = "discovery:coordinator"
+COORDINATOR_LEASE_SECONDS = 15
+COORDINATOR_RENEW_SECONDS = 5
+WORKER_ID = uuid.uuid4().hex[:8]
+
+# --- Scan Sharding ---
+# A scan target is split into shards (a /24 each, or smaller for small targets
+# so every agent slot gets work) which are handed to agents as they have room.
+
+SCAN_TYPES = ("arp", "snmp")
+SHARD_PREFIX = 24
+MIN_SHARD_PREFIX = 28
+MAX_TARGET_PREFIX = 16 # Largest accepted target: a /16
+# Shards an agent can take at once when it doesn't announce a capacity, and the most it may announce
+DEFAULT_AGENT_CAPACITY = 1
+MAX_AGENT_CAPACITY = 16
+# A shard not completed within this time is given to another agent
+SHARD_TIMEOUT_SECONDS = 300
+MAX_SHARD_ATTEMPTS = 3
+WATCHDOG_INTERVAL_SECONDS = 10
+FINISHED_SCANS_KEPT = 20
+
+def split_target(network: ipaddress.IPv4Network, parallelism: int) -> List[ipaddress.IPv4Network]:
+    prefix = max(network.prefixlen, SHARD_PREFIX)
+    while prefix < MIN_SHARD_PREFIX and 2 ** (prefix - network.prefixlen) < parallelism:
+        prefix += 1
+    if prefix == network.prefixlen:
+        return [network]
+    return list(network.subnets(new_prefix=prefix))
+
+class AgentConnection:
+    """An agent websocket held by this worker."""
+    def __init__(self, agent_id: str, websocket: WebSocket, capacity: int):
+        self.agent_id = agent_id
+        # Tells this connection apart from earlier ones of the same agent, possibly on other workers
+        self.connection_id = uuid.uuid4().hex[:12]
+        self.websocket = websocket
+        self.capacity = capacity
+        self.connected_at = time.time()
+
+class DiscoveryAgent:
+    """The coordinator's view of a connected agent, on whichever worker it is."""
+    def __init__(self, agent_id: str, connection_id: str, capacity: int, connected_at: float):
+        self.agent_id = agent_id
+        self.connection_id = connection_id
+        self.capacity = capacity
+        # shard_id -> shard currently being scanned by this agent
+        self.shards: Dict[str, "ScanShard"] = {}
+        self.completed_shards = 0
+        self.connected_at = connected_at
+
+    @property
+    def free_slots(self) -> int:
+        return self.capacity - len(self.shards)
+
+    def to_dict(self) -> dict:
+        return {
+            "agent_id": self.agent_id,
+            "capacity": self.capacity,
+            "active_shards": len(self.shards),
+            "completed_shards": self.completed_shards,
+            "connected_at": self.connected_at,
+        }
+
+class ScanShard:
+    def __init__(self, job: "ScanJob", network: ipaddress.IPv4Network):
+        self.shard_id = uuid.uuid4().hex[:12]
+        self.job = job
+        self.network = network
+        self.agent_id: Optional[str] = None
+        self.dispatched_at: Optional[float] = None
+        self.attempts = 0
+
+class ScanJob:
+    def __init__(self, scan_type: str, network: ipaddress.IPv4Network, parallelism: int):
+        self.scan_id = uuid.uuid4().hex[:12]
+        self.scan_type = scan_type
+        self.target = str(network)
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        shards = [ScanShard(self, subnet) for subnet in split_target(network, parallelism)]
+        self.shards: Dict[str, ScanShard] = {shard.shard_id: shard for shard in shards}
+        self.pending: Deque[ScanShard] = deque(shards)
+        self.completed = 0
+        self.failed = 0
+        # MAC -> merged device record
+        self.devices: Dict[str, dict] = {}
+
+    @property
+    def finished(self) -> bool:
+        return self.completed + self.failed == len(self.shards)
+
+    def to_dict(self) -> dict:
+        end = self.finished_at or time.monotonic()
+        return {
+            "scan_id": self.scan_id,
+            "scan_type": self.scan_type,
+            "target": self.target,
+            "shards": len(self.shards),
+            "pending": len(self.pending),
+            "in_progress": len(self.shards) - len(self.pending) - self.completed - self.failed,
+            "completed": self.completed,
+            "failed": self.failed,
+            "devices": len(self.devices),
+            "elapsed_s": round(end - self.started_at, 1),
+            "finished": self.finished,
+        }
+
 # --- Connection Manager for broadcasting results to all connected admins ---
 class DiscoveryConnectionManager:
     def __init__(self):
         # Connections from admin frontends
         self.frontend_connections: List[WebSocket] = []
-        # Connection from the single discovery agent
-        self.agent_connection: WebSocket | None = None
+        # Discovery agents connected to this worker, by agent id
+        self.agents: Dict[str, AgentConnection] = {}
+        self.subscribed = False
+
+    async def start(self):
+        """Subscribes to the discovery channels and joins the coordinator election."""
+        if not self.subscribed:
+            self.subscribed = True
+            await backplane.subscribe(RESULTS_CHANNEL, self._send_to_local_frontends)
+            await backplane.subscribe(COMMANDS_CHANNEL, self._on_command)
+            await backplane.subscribe(AGENT_EVENTS_CHANNEL, coordinator.handle_agent_event)
+            await backplane.subscribe(AGENT_COMMANDS_CHANNEL, self._on_agent_command)
+            await coordinator.start_election()
 
     async def connect_frontend(self, websocket: WebSocket):
+        await self.start()
         await websocket.accept()
         self.frontend_connections.append(websocket)
 
     def disconnect_frontend(self, websocket: WebSocket):
-        self.frontend_connections.remove(websocket)
-    
-    async def connect_agent(self, websocket: WebSocket):
-        await websocket.accept()
-        if self.agent_connection:
-            # Only allow one agent at a time for simplicity
-            await websocket.close(code=1008, reason="Another agent is already connected.")
+        if websocket in self.frontend_connections:
+            self.frontend_connections.remove(websocket)
+
+    async def connect_agent(self, websocket: WebSocket, agent_id: Optional[str], capacity) -> Optional[AgentConnection]:
+        await self.start()
+        agent_id = str(agent_id or uuid.uuid4().hex[:8])
+        if agent_id in self.agents:
+            await websocket.close(code=1008, reason=f"An agent with id '{agent_id}' is already connected.")
+            return None
+        try:
+            capacity = min(max(int(capacity), 1), MAX_AGENT_CAPACITY)
+        except (TypeError, ValueError):
+            capacity = DEFAULT_AGENT_CAPACITY
+        connection = AgentConnection(agent_id, websocket, capacity)
+        self.agents[agent_id] = connection
+        return connection
+
+    def disconnect_agent(self, connection: AgentConnection):
+        if self.agents.get(connection.agent_id) is connection:
+            del self.agents[connection.agent_id]
+
+    async def publish_agent_event(self, connection: AgentConnection, event: str, **fields):
+        """Reports an agent's connection, messages and disconnection to the coordinator."""
+        await backplane.publish(AGENT_EVENTS_CHANNEL, json.dumps({
+            "event": event,
+            "agent_id": connection.agent_id,
+            "connection_id": connection.connection_id,
+            **fields,
+        }))
+
+    async def announce_agent(self, connection: AgentConnection):
+        await self.publish_agent_event(connection, "connected", capacity=connection.capacity, connected_at=connection.connected_at)
+
+    async def _on_command(self, payload: str):
+        command = json.loads(payload)
+        action = command.get("action")
+        if action == "coordinate_scan" and coordinator.is_coordinator:
+            if not coordinator.agents:
+                await self.broadcast_to_frontends(json.dumps({"type": "scan_status", "data": "No discovery agent is connected."}))
+                return
+            await coordinator.start_scan(command["scan_type"], ipaddress.ip_network(command["target"]))
+        elif action == "announce_agents":
+            # A new coordinator took over and needs to learn every worker's agents
+            for connection in list(self.agents.values()):
+                await self.announce_agent(connection)
+
+    async def _on_agent_command(self, payload: str):
+        command = json.loads(payload)
+        connection = self.agents.get(command.get("agent_id"))
+        if connection is None or connection.connection_id != command.get("connection_id"):
+            return # The agent is connected to another worker
+        try:
+            await connection.websocket.send_json(command["command"])
+        except Exception as e:
+            logging.warning(f"Discovery: could not reach agent {connection.agent_id}: {e}")
+            # Ends the agent's receive loop, which reports the disconnect to the coordinator
+            try:
+                await connection.websocket.close(code=1011)
+            except Exception:
+                pass # Already closed
+
+    async def broadcast_to_frontends(self, message: str):
+        await self.start()
+        await backplane.publish(RESULTS_CHANNEL, message)
+
+    async def _send_to_local_frontends(self, message: str):
+        connections = list(self.frontend_connections)
+        results = await asyncio.gather(*(c.send_text(message) for c in connections), return_exceptions=True)
+        for connection, result in zip(connections, results):
+            if isinstance(result, Exception):
+                self.disconnect_frontend(connection)
+
+manager = DiscoveryConnectionManager()
+
+# --- Scan Coordinator ---
+class ScanCoordinator:
+    """
+    Hands the shards of every running scan to the connected agents, up to each
+    agent's capacity, and merges what they report by MAC address. Shards of an
+    agent that disconnects or stalls go back to the front of the queue.
+    Only the worker holding COORDINATOR_LEASE acts; agents on other workers are
+    reached through the backplane.
+    """
+    def __init__(self, manager: DiscoveryConnectionManager):
+        self.manager = manager
+        self.is_coordinator = False
+        # Agents connected to any worker, by agent id
+        self.agents: Dict[str, DiscoveryAgent] = {}
+        self.jobs: Dict[str, ScanJob] = {}
+        self.watchdog: Optional[asyncio.Task] = None
+        self.election: Optional[asyncio.Task] = None
+
+    async def start_election(self):
+        if self.election is None:
+            # The first attempt runs right away, so a single worker coordinates from the start
+            await self._renew_lease()
+            self.election = asyncio.create_task(self._elect())
+
+    async def _elect(self):
+        while True:
+            await asyncio.sleep(COORDINATOR_RENEW_SECONDS)
+            await self._renew_lease()
+
+    async def _renew_lease(self):
+        try:
+            holds_lease = await backplane.acquire_lease(COORDINATOR_LEASE, WORKER_ID, COORDINATOR_LEASE_SECONDS)
+        except Exception as e:
+            # The lease may expire before it can be renewed; stop coordinating to be safe
+            logging.error(f"Discovery: could not renew the coordinator lease: {e}")
+            holds_lease = False
+        if holds_lease and not self.is_coordinator:
+            logging.info(f"Discovery: worker {WORKER_ID} now coordinates scans.")
+            self.is_coordinator = True
+            self.agents.clear()
+            try:
+                await backplane.publish(COMMANDS_CHANNEL, json.dumps({"action": "announce_agents"}))
+            except Exception as e:
+                logging.error(f"Discovery: could not ask the workers for their agents: {e}")
+        elif not holds_lease and self.is_coordinator:
+            logging.warning(f"Discovery: worker {WORKER_ID} lost the coordinator lease; its running scans are abandoned.")
+            self.is_coordinator = False
+            self.agents.clear()
+            self.jobs.clear()
+
+    async def stop(self):
+        if self.election:
+            self.election.cancel()
+        if self.watchdog:
+            self.watchdog.cancel()
+        if self.is_coordinator:
+            self.is_coordinator = False
+            await backplane.release_lease(COORDINATOR_LEASE, WORKER_ID)
+
+    async def handle_agent_event(self, payload: str):
+        if not self.is_coordinator:
+            return
+        event = json.loads(payload)
+        agent_id = event.get("agent_id")
+        agent = self.agents.get(agent_id)
+        if event.get("event") == "connected":
+            if agent and agent.connection_id == event.get("connection_id"):
+                return # Already known, e.g. announced twice
+            if agent:
+                # Reconnected, maybe to another worker, before its old connection was reported closed
+                await self._release_agent(agent)
+            self.agents[agent_id] = DiscoveryAgent(agent_id, event["connection_id"], event["capacity"], event["connected_at"])
+            # Queued shards can start right away
+            await self.dispatch()
+            return
+        if agent is None or agent.connection_id != event.get("connection_id"):
+            return # From a connection that has since been replaced
+        if event.get("event") == "disconnected":
+            del self.agents[agent_id]
+            await self._release_agent(agent)
+            await self.dispatch()
+        elif event.get("event") == "message":
+            await self.handle_agent_message(agent, event.get("message") or {})
+
+    async def start_scan(self, scan_type: str, network: ipaddress.IPv4Network) -> ScanJob:
+        parallelism = sum(agent.capacity for agent in self.agents.values())
+        job = ScanJob(scan_type, network, parallelism)
+        self.jobs[job.scan_id] = job
+        self._prune_finished()
+        logging.info(f"Discovery: {scan_type} scan {job.scan_id} of {job.target} split into {len(job.shards)} shards.")
+        await self._publish_status(job, f"Scanning {job.target} with {len(self.agents)} agent(s)...")
+        if self.watchdog is None or self.watchdog.done():
+            self.watchdog = asyncio.create_task(self._watch())
+        await self.dispatch()
+        return job
+
+    def _prune_finished(self):
+        finished = [job for job in self.jobs.values() if job.finished]
+        for job in finished[:-FINISHED_SCANS_KEPT]:
+            del self.jobs[job.scan_id]
+
+    def _find_shard(self, shard_id) -> Optional[ScanShard]:
+        for job in self.jobs.values():
+            if shard_id in job.shards:
+                return job.shards[shard_id]
+        return None
+
+    async def dispatch(self):
+        """Sends pending shards, oldest scan first, to the agents with the most free slots."""
+        if not self.is_coordinator:
+            return
+        for job in list(self.jobs.values()):
+            while job.pending:
+                agent = max(self.agents.values(), key=lambda a: a.free_slots, default=None)
+                if agent is None or agent.free_slots <= 0:
+                    return
+                shard = job.pending.popleft()
+                shard.agent_id = agent.agent_id
+                shard.dispatched_at = time.monotonic()
+                shard.attempts += 1
+                agent.shards[shard.shard_id] = shard
+                try:
+                    # The worker holding the agent's websocket passes the command on
+                    await backplane.publish(AGENT_COMMANDS_CHANNEL, json.dumps({
+                        "agent_id": agent.agent_id,
+                        "connection_id": agent.connection_id,
+                        "command": {
+                            "action": "scan",
+                            "scan_type": job.scan_type,
+                            "scan_id": job.scan_id,
+                            "shard_id": shard.shard_id,
+                            "target": str(shard.network),
+                        },
+                    }))
+                except Exception as e:
+                    logging.error(f"Discovery: could not send shard {shard.network} to agent {agent.agent_id}: {e}")
+                    del agent.shards[shard.shard_id]
+                    self._requeue(shard, "backplane unavailable")
+                    await self._check_finished(job)
+                    return
+
+    def _requeue(self, shard: ScanShard, reason: str) -> bool:
+        """Puts a shard back in the queue; returns False if it has run out of attempts."""
+        job = shard.job
+        shard.agent_id = None
+        shard.dispatched_at = None
+        if shard.attempts >= MAX_SHARD_ATTEMPTS:
+            job.failed += 1
+            logging.warning(f"Discovery: giving up on shard {shard.network} of scan {job.scan_id} ({reason}).")
             return False
-        self.agent_connection = websocket
+        job.pending.appendleft(shard)
+        logging.info(f"Discovery: requeued shard {shard.network} of scan {job.scan_id} ({reason}).")
         return True
 
-    def disconnect_agent(self):
-        self.agent_connection = None
-    
-    async def send_command_to_agent(self, command: dict):
-        if self.agent_connection:
-            await self.agent_connection.send_json(command)
+    async def _release_agent(self, agent: DiscoveryAgent):
+        shards = list(agent.shards.values())
+        agent.shards.clear()
+        for shard in shards:
+            self._requeue(shard, f"agent {agent.agent_id} disconnected")
+        for job in {shard.job for shard in shards}:
+            await self._check_finished(job)
+
+    async def handle_agent_message(self, agent: DiscoveryAgent, message: dict):
+        message_type = message.get("type")
+        shard = agent.shards.get(message.get("shard_id"))
+        if message_type == "device_fingerprinted":
+            # Late results from a reassigned shard are still valid; merging by MAC makes them idempotent
+            shard = shard or self._find_shard(message.get("shard_id"))
+            device = message.get("data") or {}
+            if shard is None or not device.get("mac"):
+                await self.manager.broadcast_to_frontends(json.dumps(message))
+                return
+            merged = self._merge_device(shard.job, device, agent.agent_id)
+            await self.manager.broadcast_to_frontends(json.dumps({"type": "device_fingerprinted", "scan_id": shard.job.scan_id, "data": merged}))
+        elif message_type in ("shard_complete", "shard_failed"):
+            if shard is None:
+                return # The shard timed out and was reassigned; the new holder reports it
+            del agent.shards[shard.shard_id]
+            if message_type == "shard_complete":
+                shard.job.completed += 1
+                agent.completed_shards += 1
+            else:
+                self._requeue(shard, f"agent {agent.agent_id} reported: {message.get('error')}")
+            job = shard.job
+            await self._publish_status(job, f"Scanning {job.target}: {job.completed}/{len(job.shards)} shards, {len(job.devices)} devices")
+            await self._check_finished(job)
+            await self.dispatch()
         else:
-            raise HTTPException(status_code=503, detail="No discovery agent is connected.")
+            # Progress and other agent messages go to the frontends unchanged
+            await self.manager.broadcast_to_frontends(json.dumps({**message, "agent_id": agent.agent_id}))
 
-    async def broadcast_to_frontends(self, message: str):
-        for connection in self.frontend_connections:
-            await connection.send_text(message)
+    def _merge_device(self, job: ScanJob, device: dict, agent_id: str) -> dict:
+        mac = device["mac"].lower().replace("-", ":")
+        merged = job.devices.setdefault(mac, {"mac": mac, "seen_by": []})
+        # Several probes may see the same device; keep every field any of them filled in
+        merged.update({key: value for key, value in device.items() if value not in (None, "") and key != "mac"})
+        if agent_id not in merged["seen_by"]:
+            merged["seen_by"].append(agent_id)
+        return merged
 
-manager = DiscoveryConnectionManager()
+    async def _check_finished(self, job: ScanJob):
+        if job.finished and job.finished_at is None:
+            job.finished_at = time.monotonic()
+            elapsed = job.finished_at - job.started_at
+            logging.info(f"Discovery: scan {job.scan_id} of {job.target} finished in {elapsed:.1f}s with {len(job.devices)} devices.")
+            failed = f", {job.failed} shard(s) failed" if job.failed else ""
+            await self._publish_status(job, f"Scan of {job.target} complete: {len(job.devices)} devices in {elapsed:.0f}s{failed}.")
+
+    async def _publish_status(self, job: ScanJob, text: str):
+        await self.manager.broadcast_to_frontends(json.dumps({"type": "scan_status", "data": text, "scan": job.to_dict()}))
+
+    async def _watch(self):
+        """Reassigns shards an agent has held for longer than SHARD_TIMEOUT_SECONDS."""
+        while any(not job.finished for job in self.jobs.values()):
+            await asyncio.sleep(WATCHDOG_INTERVAL_SECONDS)
+            now = time.monotonic()
+            for agent in list(self.agents.values()):
+                for shard in [s for s in agent.shards.values() if now - s.dispatched_at > SHARD_TIMEOUT_SECONDS]:
+                    del agent.shards[shard.shard_id]
+                    self._requeue(shard, f"timed out on agent {agent.agent_id}")
+                    await self._check_finished(shard.job)
+            await self.dispatch()
+
+    def get_status(self) -> dict:
+        return {
+            "worker": WORKER_ID,
+            "coordinator": self.is_coordinator,
+            "local_agents": list(self.manager.agents),
+            "agents": [agent.to_dict() for agent in self.agents.values()],
+            "scans": [job.to_dict() for job in self.jobs.values()],
+        }
+
+coordinator = ScanCoordinator(manager)
 AGENT_SECRET_KEY = "a_very_secret_key_to_authenticate_agents" # Should be in .env
 
-# --- WebSocket for the Discovery Agent ---
+class ScanRequest(BaseModel):
+    target: str # e.g. "10.20.0.0/16"
+
+# --- WebSocket for the Discovery Agents ---
 @router.websocket("/ws/agent")
 async def register_agent(websocket: WebSocket):
+    await websocket.accept()
+    connection = None
     try:
+        # {"type": "agent_auth", "key": ..., "agent_id": "site-a-1", "capacity": 4}
         auth_message = await websocket.receive_json()
-        if not (auth_message.get("type") == "agent_auth" and auth_message.get("key") == AGENT_SECRET_KEY):
-            await websocket.close(reason="Authentication failed")
+        if not (auth_message.get("type") == "agent_auth" and hmac.compare_digest(str(auth_message.get("key", "")), AGENT_SECRET_KEY)):
+            await websocket.close(code=1008, reason="Authentication failed")
             return
 
-        if not await manager.connect_agent(websocket):
+        connection = await manager.connect_agent(websocket, auth_message.get("agent_id"), auth_message.get("capacity", DEFAULT_AGENT_CAPACITY))
+        if connection is None:
             return
-            
-        await websocket.send_json({"status": "authenticated"})
-        print("Discovery agent connected.")
+
+        await websocket.send_json({"status": "authenticated", "agent_id": connection.agent_id, "capacity": connection.capacity})
+        logging.info(f"Discovery agent {connection.agent_id} connected to worker {WORKER_ID} (capacity {connection.capacity}).")
+        await manager.announce_agent(connection)
 
         while True:
-            # Listen for results from the agent
+            # Listen for results from the agent and pass them to the coordinator
             result = await websocket.receive_json()
-            # Broadcast results to all connected admin frontends
-            await manager.broadcast_to_frontends(json.dumps(result))
+            await manager.publish_agent_event(connection, "message", message=result)
 
     except WebSocketDisconnect:
-        manager.disconnect_agent()
-        print("Discovery agent disconnected.")
+        pass
+    finally:
+        if connection:
+            manager.disconnect_agent(connection)
+            await manager.publish_agent_event(connection, "disconnected")
+            logging.info(f"Discovery agent {connection.agent_id} disconnected.")
+
+# --- Scans ---
+@router.post("/scan/{scan_type}")
+async def start_scan(scan_type: str, request: ScanRequest):
+    """Starts a scan of a CIDR range, sharded across the agents connected to all workers."""
+    if scan_type not in SCAN_TYPES:
+        raise HTTPException(status_code=404, detail=f"Unknown scan type '{scan_type}'.")
+    try:
+        network = ipaddress.ip_network(request.target.strip(), strict=False)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Target must be an IPv4 address or CIDR range.")
+    if network.version != 4 or network.prefixlen < MAX_TARGET_PREFIX:
+        raise HTTPException(status_code=400, detail=f"Target must be an IPv4 range no larger than a /{MAX_TARGET_PREFIX}.")
+
+    await manager.start()
+    if not coordinator.is_coordinator:
+        # Another worker coordinates; progress reaches the frontends over the results channel
+        await manager.broadcast_to_frontends(json.dumps({"type": "scan_status", "data": f"Forwarding scan of {network}..."}))
+        await backplane.publish(COMMANDS_CHANNEL, json.dumps({"action": "coordinate_scan", "scan_type": scan_type, "target": str(network)}))
+        return {"status": "forwarded", "target": str(network)}
+    if not coordinator.agents:
+        raise HTTPException(status_code=503, detail="No discovery agent is connected.")
+
+    job = await coordinator.start_scan(scan_type, network)
+    return job.to_dict()
+
+@router.get("/status")
+def get_discovery_status():
+    """
+    Lists the connected agents and the progress of recent scans. Both are only
+    known to the coordinating worker; other workers list just their own agents.
+    """
+    return coordinator.get_status()
 
 # --- WebSocket for Admin Frontends to receive live results ---
 @router.websocket("/ws/subscribe")
-async def subscribe_t
+async def subscribe_to_results(websocket: WebSocket):
+    await manager.connect_frontend(websocket)
+    try:
+        while True:
+            # Frontends only listen; this keeps the connection open until they leave
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect_frontend(websocket)
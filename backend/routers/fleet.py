@@ -0,0 +1,173 @@
+# backend/routers/fleet.py
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, conint
+from sqlalchemy.orm import Session
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import asyncio
+import functools
+import json
+import re
+import time
+
+import models, database
+from dependencies import require_permission
+from connectors.mikrotik_connector import run_api_call
+from connectors.cisco_connector import cisco_session
+from connectors.mikrotik_async import run_blocking
+
+router = APIRouter(
+    prefix="/api/fleet",
+    tags=["Fleet"],
+    dependencies=[Depends(require_permission("fleet:query"))] # A new permission
+)
+
+FLEET_CONCURRENCY = 50
+DEFAULT_DEVICE_TIMEOUT_SECONDS = 20
+MAX_DEVICE_TIMEOUT_SECONDS = 120
+
+# Cisco jobs get their own threads; MikroTik jobs go through the shared RouterOS executor
+_cisco_executor = ThreadPoolExecutor(max_workers=FLEET_CONCURRENCY, thread_name_prefix="fleet-cisco")
+
+ROUTEROS_PATH_PATTERN = re.compile(r"(/[a-z0-9\-]+)+")
+# Cisco fleet commands: 'show <allowed subcommand> [args] [| <allowed filter> <pattern>]'
+CISCO_SHOW_SUBCOMMANDS = {
+    "version", "clock", "inventory", "interfaces", "ip", "ipv6", "vlan", "cdp", "lldp", "mac",
+    "arp", "spanning-tree", "environment", "processes", "memory", "logging", "ntp", "module",
+    "power", "etherchannel", "standby", "vrrp", "license", "boot", "users", "platform", "vtp",
+}
+CISCO_OUTPUT_FILTERS = {"include", "exclude", "begin", "section", "count", "i", "e", "b", "s"}
+CISCO_ARGUMENT_PATTERN = re.compile(r"[A-Za-z0-9./:_\-]+")
+CONTROL_CHARACTERS = re.compile(r"[\x00-\x1f\x7f]")
+
+class FleetSelector(BaseModel):
+    vendor: str # 'MikroTik' or 'Cisco'
+    device_ids: Optional[List[int]] = None # None selects every active device of the vendor
+
+class FleetQuery(BaseModel):
+    selector: FleetSelector
+    # A RouterOS menu path (e.g. '/system/resource') for MikroTik, a 'show' command for Cisco
+    command: str
+    timeout: conint(ge=1, le=MAX_DEVICE_TIMEOUT_SECONDS) = DEFAULT_DEVICE_TIMEOUT_SECONDS
+
+def _validate_cisco_command(command: str) -> bool:
+    main, *filters = [part.split() for part in command.split("|")]
+    if len(main) < 2 or main[0].lower() != "show" or main[1].lower() not in CISCO_SHOW_SUBCOMMANDS:
+        return False
+    if not all(CISCO_ARGUMENT_PATTERN.fullmatch(token) for token in main):
+        return False
+    # Output filters only narrow what is printed; 'redirect', 'tee' and friends are not allowed
+    for tokens in filters:
+        if len(tokens) < 2 or tokens[0].lower() not in CISCO_OUTPUT_FILTERS:
+            return False
+    return True
+
+def _validate_command(vendor: str, command: str):
+    """Only read-only commands may be fanned out across the fleet."""
+    # A newline would make the device run a second command after the checked one
+    if CONTROL_CHARACTERS.search(command):
+        raise HTTPException(status_code=400, detail="Fleet commands must be a single line without control characters.")
+    if vendor == 'MikroTik':
+        # Resources are only ever read with '.get()' (the API equivalent of 'print')
+        if not ROUTEROS_PATH_PATTERN.fullmatch(command):
+            raise HTTPException(status_code=400, detail="MikroTik fleet commands must be a menu path like '/ppp/secret'.")
+    elif vendor == 'Cisco':
+        if not _validate_cisco_command(command):
+            raise HTTPException(status_code=400, detail="Cisco fleet commands must be read-only 'show' commands.")
+    else:
+        raise HTTPException(status_code=400, detail=f"Fleet queries are not supported for vendor '{vendor}'.")
+
+# Each job opens its own DB session, since a Session must not be shared between threads.
+
+def _query_mikrotik(device_id: int, path: str):
+    db = database.SessionLocal()
+    try:
+        return run_api_call(db, device_id, lambda api: api.get_resource(path).get())
+    finally:
+        db.close()
+
+def _query_cisco(device_id: int, protocol: str, command: str):
+    if protocol != 'ssh':
+        raise ValueError(f"CLI commands require SSH, device uses '{protocol}'.")
+    db = database.SessionLocal()
+    try:
+        with cisco_session(db, device_id) as handler:
+            return handler.send_command(command)
+    finally:
+        db.close()
+
+async def _run_on_device(device: models.Device, query: FleetQuery):
+    if device.vendor == 'MikroTik':
+        return await run_blocking(device.id, _query_mikrotik, device.id, query.command)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _cisco_executor,
+        functools.partial(_query_cisco, device.id, device.management_protocol, query.command)
+    )
+
+async def _stream_results(devices: List[models.Device], query: FleetQuery):
+    semaphore = asyncio.Semaphore(FLEET_CONCURRENCY)
+    started = time.monotonic()
+
+    def job_finished(job: asyncio.Future):
+        semaphore.release()
+        if not job.cancelled():
+            job.exception() # Retrieve it, so a late failure of a timed-out job isn't logged as unhandled
+
+    async def run_one(device):
+        await semaphore.acquire()
+        # A timeout only stops the waiting: the blocking call keeps its thread until the
+        # device answers, so the slot is released when the job itself ends
+        job = asyncio.ensure_future(_run_on_device(device, query))
+        job.add_done_callback(job_finished)
+        device_started = time.monotonic()
+        line = {"type": "result", "device_id": device.id, "name": device.name}
+        try:
+            line["result"] = await asyncio.wait_for(asyncio.shield(job), timeout=query.timeout)
+            line["status"] = "ok"
+        except asyncio.TimeoutError:
+            line["status"] = "timeout"
+        except HTTPException as e:
+            line["status"] = "error"
+            line["error"] = e.detail
+        except Exception as e:
+            line["status"] = "error"
+            line["error"] = str(e)
+        line["elapsed_ms"] = round((time.monotonic() - device_started) * 1000)
+        return line
+
+    counts = {"ok": 0, "error": 0, "timeout": 0}
+    for next_result in asyncio.as_completed([run_one(d) for d in devices]):
+        line = await next_result
+        counts[line["status"]] += 1
+        yield json.dumps(line, default=str) + "\n"
+
+    yield json.dumps({
+        "type": "summary",
+        "devices": len(devices),
+        **counts,
+        "elapsed_ms": round((time.monotonic() - started) * 1000),
+    }) + "\n"
+
+@router.post("/query")
+async def run_fleet_query(query: FleetQuery, db: Session = Depends(database.get_db)):
+    """
+    Runs one read-only command across every selected device with bounded parallelism.
+    Results are streamed as NDJSON, one line per device in completion order,
+    followed by a summary line.
+    """
+    _validate_command(query.selector.vendor, query.command)
+
+    device_query = db.query(models.Device).filter(
+        models.Device.vendor == query.selector.vendor,
+        models.Device.is_active == True
+    )
+    if query.selector.device_ids is not None:
+        device_query = device_query.filter(models.Device.id.in_(query.selector.device_ids))
+    devices = device_query.all()
+    if not devices:
+        raise HTTPException(status_code=404, detail="No active devices match the selector.")
+
+    return StreamingResponse(_stream_results(devices, query), media_type="application/x-ndjson")
@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-import database, schemas
+import schemas
 from security import get_current_user
-from connectors.mikrotik_connector import get_api_connector
+from connectors import mikrotik_async
+from connectors.mikrotik_connector import pool_manager
 
 router = APIRouter(
     prefix="/api/mikrotik/devices/{device_id}",
@@ -11,22 +11,30 @@ router = APIRouter(
 )
 
 @router.get("/resources")
-def get_mikrotik_resources(device_id: int, db: Session = Depends(database.get_db)):
+async def get_mikrotik_resources(device_id: int):
     """Gets system resources for a specific MikroTik device."""
-    api = get_api_connector(db, device_id)
-    resources = api.get_resource('/system/resource').get()
+    resources = await mikrotik_async.get_resource(device_id, '/system/resource')
     return resources[0] if resources else {}
 
 @router.get("/hotspot/users")
-def get_hotspot_users(device_id: int, db: Session = Depends(database.get_db)):
+async def get_hotspot_users(device_id: int):
     """Gets the list of configured Hotspot users."""
-    api = get_api_connector(db, device_id)
-    return api.get_resource('/ip/hotspot/user').get()
+    return await mikrotik_async.get_resource(device_id, '/ip/hotspot/user')
 
 @router.get("/ppp/secrets")
-def get_ppp_secrets(device_id: int, db: Session = Depends(database.get_db)):
+async def get_ppp_secrets(device_id: int):
     """Gets the list of PPP secrets (for VPN/PPPoE)."""
-    api = get_api_connector(db, device_id)
-    return api.get_resource('/ppp/secret').get()
+    return await mikrotik_async.get_resource(device_id, '/ppp/secret')
+
+@router.get("/pool/stats")
+def get_mikrotik_pool_stats(device_id: int):
+    """Reports the connection pool counters (hits, misses, reconnects, evictions)."""
+    stats = pool_manager.get_stats()
+    device_pool = pool_manager.pools.get(device_id)
+    stats["device"] = {
+        "idle_sessions": len(device_pool.idle) if device_pool else 0,
+        "leased_sessions": device_pool.in_use if device_pool else 0,
+    }
+    return stats
 
 # ... other MikroTik specific endpoints (active users, profiles, etc.)
@@ -4,7 +4,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
 import models, schemas, database
-from dependencies import require_permission
+from dependencies import require_permission, invalidate_role_permissions
 
 router = APIRouter(
     prefix="/api/administration/roles",
@@ -49,6 +49,7 @@ def update_role_permissions(role_id: int, permission_ids: List[int], db: Session
         db.add(models.RolePermission(role_id=role_id, permission_id=p_id))
         
     db.commit()
+    invalidate_role_permissions(role_id)
     return {"status": "success"}
 
 # --- Permissions Endpoint ---
@@ -1,30 +1,132 @@
 # backend/routers/tickets.py
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from pydantic import BaseModel
+from sqlalchemy import and_, or_, func, text
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import base64
+import html
+import json
+import re
+import threading
+import time
 import models, schemas, database
 from security import get_current_user_from_token
-from dependencies import require_permission # Dependency برای کنترل دسترسی
+from dependencies import require_permission, user_has_permission # Dependency برای کنترل دسترسی
 
 router = APIRouter(
     prefix="/api/tickets",
     tags=["Support Tickets"]
 )
 
+# --- Keyset Pagination ---
+# Ticket lists are ordered by (updated_at, id) descending and paged with an opaque
+# cursor holding the last row's sort key, so every page is an index range scan
+# (see the tickets indexes in database/schema.sql) no matter how deep it is.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+COUNT_CACHE_TTL_SECONDS = 60
+# Filter values come from the client, so the count cache is bounded
+COUNT_CACHE_MAX_ENTRIES = 1000
+STATUS_MAX_LENGTH = 20 # tickets.status is a varchar(20)
+
+class TicketPage(BaseModel):
+    items: List[schemas.Ticket]
+    next_cursor: Optional[str] = None
+    total_estimate: Optional[int] = None
+
+def _encode_cursor(ticket: models.Ticket) -> str:
+    raw = json.dumps([ticket.updated_at.isoformat(), ticket.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        updated_at, ticket_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(updated_at), int(ticket_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _paginate_tickets(query, cursor: Optional[str], limit: int) -> Tuple[List[models.Ticket], Optional[str]]:
+    if cursor:
+        updated_at, ticket_id = _decode_cursor(cursor)
+        query = query.filter(or_(
+            models.Ticket.updated_at < updated_at,
+            and_(models.Ticket.updated_at == updated_at, models.Ticket.id < ticket_id)
+        ))
+    # Fetch one extra row to know whether there is a next page
+    rows = query.order_by(models.Ticket.updated_at.desc(), models.Ticket.id.desc()).limit(limit + 1).all()
+    if len(rows) > limit:
+        return rows[:limit], _encode_cursor(rows[limit - 1])
+    return rows, None
+
+# filters -> (expires_at, count)
+_count_cache: Dict[tuple, Tuple[float, int]] = {}
+_count_cache_lock = threading.Lock()
+
+def _remember_count(filters: tuple, total: int):
+    now = time.monotonic()
+    with _count_cache_lock:
+        _count_cache.pop(filters, None)
+        if len(_count_cache) >= COUNT_CACHE_MAX_ENTRIES:
+            for key in [k for k, entry in _count_cache.items() if entry[0] <= now]:
+                del _count_cache[key]
+            # Still full: drop the oldest entries (dicts keep insertion order)
+            for key in list(_count_cache)[:len(_count_cache) - COUNT_CACHE_MAX_ENTRIES + 1]:
+                del _count_cache[key]
+        _count_cache[filters] = (now + COUNT_CACHE_TTL_SECONDS, total)
+
+def _estimate_total(db: Session, query, filters: tuple) -> int:
+    """
+    Unfiltered totals come from the InnoDB row estimate; filtered totals are a real
+    COUNT(*) cached for COUNT_CACHE_TTL_SECONDS, so paging never recounts.
+    """
+    cached = _count_cache.get(filters)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    if not any(value is not None for value in filters[1:]):
+        total = db.execute(text(
+            "SELECT TABLE_ROWS FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'tickets'"
+        )).scalar()
+    else:
+        total = query.order_by(None).count()
+    _remember_count(filters, total or 0)
+    return total or 0
+
 # --- API Endpoints for Admins/Support Staff ---
 
 @router.get(
     "/all", 
-    response_model=List[schemas.Ticket], 
+    response_model=TicketPage, 
     dependencies=[Depends(require_permission("tickets:read:all"))]
 )
-def read_all_tickets(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db)):
+def read_all_tickets(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    status: Optional[str] = Query(None, max_length=STATUS_MAX_LENGTH),
+    assignee_id: Optional[int] = None,
+    creator_id: Optional[int] = None,
+    db: Session = Depends(database.get_db)
+):
     """
-    (Admin) Gets a list of all tickets in the system.
+    (Admin) Gets a page of tickets, most recently updated first.
+    Pass the returned `next_cursor` as `cursor` to get the following page.
     """
-    tickets = db.query(models.Ticket).order_by(models.Ticket.updated_at.desc()).offset(skip).limit(limit).all()
-    return tickets
+    query = db.query(models.Ticket)
+    if status is not None:
+        query = query.filter(models.Ticket.status == status)
+    if assignee_id is not None:
+        query = query.filter(models.Ticket.assigned_to_user_id == assignee_id)
+    if creator_id is not None:
+        query = query.filter(models.Ticket.created_by_user_id == creator_id)
+
+    items, next_cursor = _paginate_tickets(query, cursor, limit)
+    total = _estimate_total(db, query, ("all", status, assignee_id, creator_id))
+    return {"items": items, "next_cursor": next_cursor, "total_estimate": total}
 
 @router.put(
     "/{ticket_id}/assign", 
@@ -108,17 +210,124 @@ def create_ticket(
 
 @router.get(
     "/my", 
-    response_model=List[schemas.Ticket],
+    response_model=TicketPage,
     dependencies=[Depends(require_permission("tickets:read:own"))]
 )
 def read_my_tickets(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    status: Optional[str] = Query(None, max_length=STATUS_MAX_LENGTH),
+    db: Session = Depends(database.get_db), 
+    current_user: models.User = Depends(get_current_user_from_token)
+):
+    """
+    Gets a page of the tickets created by the current user, most recently updated first.
+    """
+    query = db.query(models.Ticket).filter(models.Ticket.created_by_user_id == current_user.id)
+    if status is not None:
+        query = query.filter(models.Ticket.status == status)
+    items, next_cursor = _paginate_tickets(query, cursor, limit)
+    return {"items": items, "next_cursor": next_cursor}
+
+# --- Full-Text Search ---
+# Backed by the FULLTEXT indexes on tickets.title and ticket_replies.message.
+
+SEARCH_MAX_RESULTS = 50
+SNIPPET_LENGTH = 160
+TITLE_MATCH_WEIGHT = 2.0 # A hit in the title ranks above the same hit in a reply
+
+def _highlight(text_value: str, terms: List[str]) -> str:
+    """Returns an HTML-escaped window of the text around the first hit, with hits in <mark>."""
+    lowered = text_value.lower()
+    positions = [lowered.find(term) for term in terms if lowered.find(term) >= 0]
+    start = max(0, min(positions) - SNIPPET_LENGTH // 3) if positions else 0
+    window = text_value[start:start + SNIPPET_LENGTH]
+    snippet = html.escape(window)
+    if terms:
+        # One pass over all terms, so a term can't match inside an inserted <mark> tag
+        pattern = "|".join(re.escape(html.escape(term)) for term in sorted(terms, key=len, reverse=True))
+        snippet = re.sub(f"({pattern})", r"<mark>\1</mark>", snippet, flags=re.IGNORECASE)
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if start + SNIPPET_LENGTH < len(text_value) else ""
+    return prefix + snippet + suffix
+
+@router.get("/search")
+def search_tickets(
+    q: str = Query(..., min_length=3),
+    limit: int = Query(20, ge=1, le=SEARCH_MAX_RESULTS),
     db: Session = Depends(database.get_db), 
     current_user: models.User = Depends(get_current_user_from_token)
 ):
     """
-    Gets a list of all tickets created by the current user.
+    Searches ticket titles and reply messages, best matches first.
+    Users without 'tickets:read:all' only see tickets they created or are assigned to,
+    the same rule as read_ticket_details.
+    """
+    params = {"q": q, "limit": limit}
+    access_filter = ""
+    if not user_has_permission(db, current_user, "tickets:read:all"):
+        access_filter = "AND (t.created_by_user_id = :user_id OR t.assigned_to_user_id = :user_id)"
+        params["user_id"] = current_user.id
+
+    title_hits = db.execute(text(f"""
+        SELECT t.id, t.title, t.status, t.updated_at,
+               MATCH(t.title) AGAINST (:q IN NATURAL LANGUAGE MODE) AS score
+        FROM tickets t
+        WHERE MATCH(t.title) AGAINST (:q IN NATURAL LANGUAGE MODE) {access_filter}
+        ORDER BY score DESC
+        LIMIT :limit
+    """), params).all()
+
+    reply_hits = db.execute(text(f"""
+        SELECT r.id AS reply_id, r.message, t.id, t.title, t.status, t.updated_at,
+               MATCH(r.message) AGAINST (:q IN NATURAL LANGUAGE MODE) AS score
+        FROM ticket_replies r
+        JOIN tickets t ON t.id = r.ticket_id
+        WHERE MATCH(r.message) AGAINST (:q IN NATURAL LANGUAGE MODE) {access_filter}
+        ORDER BY score DESC
+        LIMIT :reply_limit
+    """), {**params, "reply_limit": limit * 3}).all()
+
+    terms = [term.lower() for term in re.findall(r"\w+", q) if len(term) >= 3]
+    results: Dict[int, dict] = {}
+
+    for row in title_hits:
+        results[row.id] = {
+            "ticket_id": row.id, "title": row.title, "status": row.status, "updated_at": row.updated_at,
+            "score": float(row.score) * TITLE_MATCH_WEIGHT,
+            "title_highlight": _highlight(row.title, terms), "matching_replies": [],
+        }
+    for row in reply_hits:
+        result = results.setdefault(row.id, {
+            "ticket_id": row.id, "title": row.title, "status": row.status, "updated_at": row.updated_at,
+            "score": 0.0, "title_highlight": html.escape(row.title), "matching_replies": [],
+        })
+        result["score"] = max(result["score"], float(row.score))
+        if len(result["matching_replies"]) < 3:
+            result["matching_replies"].append({"reply_id": row.reply_id, "snippet": _highlight(row.message, terms)})
+
+    ranked = sorted(results.values(), key=lambda r: r["score"], reverse=True)[:limit]
+    return {"query": q, "results": ranked}
+
+# --- Ticket Access ---
+
+def _ensure_ticket_access(db: Session, ticket_id: int, current_user: models.User):
+    """
+    Security check: User must be the creator, assignee, or an admin with full read access.
+    Only the two ownership columns are read, so it's cheap enough for every reply.
     """
-    return db.query(models.Ticket).filter(models.Ticket.created_by_user_id == current_user.id).order_by(models.Ticket.updated_at.desc()).all()
+    ownership = db.query(models.Ticket.created_by_user_id, models.Ticket.assigned_to_user_id).filter(
+        models.Ticket.id == ticket_id
+    ).first()
+    if not ownership:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    if not (ownership.created_by_user_id == current_user.id or 
+            ownership.assigned_to_user_id == current_user.id or
+            user_has_permission(db, current_user, "tickets:read:all")):
+        raise HTTPException(status_code=403, detail="Not authorized to view this ticket")
+
+DEFAULT_REPLIES_PAGE_SIZE = 100
+MAX_REPLIES_PAGE_SIZE = 500
 
 @router.get(
     "/{ticket_id}", 
@@ -126,24 +335,43 @@ def read_my_tickets(
 )
 def read_ticket_details(
     ticket_id: int,
+    response: Response,
+    replies_after: Optional[int] = None,
+    replies_limit: int = Query(DEFAULT_REPLIES_PAGE_SIZE, ge=1, le=MAX_REPLIES_PAGE_SIZE),
     db: Session = Depends(database.get_db), 
     current_user: models.User = Depends(get_current_user_from_token)
 ):
     """
-    Gets the full details and all replies for a single ticket.
+    Gets the details of a single ticket with a page of its replies (oldest first).
     Ensures the user has permission to view it.
+    Long threads are paged: when more replies exist, the `X-Next-Replies-Cursor`
+    response header holds the value to pass as `replies_after`.
+    The ticket, its replies and their authors are loaded in a fixed number of queries.
     """
     db_ticket = db.query(models.Ticket).filter(models.Ticket.id == ticket_id).first()
     if not db_ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
     
     # Security check: User must be the creator, assignee, or an admin with full read access.
-    user_permissions = {p.name for p in current_user.role.permissions}
     if not (db_ticket.created_by_user_id == current_user.id or 
             db_ticket.assigned_to_user_id == current_user.id or
-            "tickets:read:all" in user_permissions):
+            user_has_permission(db, current_user, "tickets:read:all")):
         raise HTTPException(status_code=403, detail="Not authorized to view this ticket")
-        
+
+    # Replies are ordered by id, which follows creation order, so the cursor is the last id seen
+    replies_query = db.query(models.TicketReply).options(
+        joinedload(models.TicketReply.user)
+    ).filter(models.TicketReply.ticket_id == ticket_id)
+    if replies_after is not None:
+        replies_query = replies_query.filter(models.TicketReply.id > replies_after)
+    replies = replies_query.order_by(models.TicketReply.id.asc()).limit(replies_limit + 1).all()
+
+    if len(replies) > replies_limit:
+        replies = replies[:replies_limit]
+        response.headers["X-Next-Replies-Cursor"] = str(replies[-1].id)
+
+    # Hand the page to the relationship so serialization doesn't lazy-load the whole thread
+    set_committed_value(db_ticket, "replies", replies)
     return db_ticket
 
 @router.post(
@@ -160,8 +388,7 @@ def create_ticket_reply(
     """
     Adds a new reply to an existing ticket.
     """
-    # First, run the same security check as read_ticket_details to ensure user can access this ticket
-    read_ticket_details(ticket_id, db, current_user)
+    _ensure_ticket_access(db, ticket_id, current_user)
 
     db_reply = models.TicketReply(
         message=reply.message,
@@ -169,12 +396,10 @@ def create_ticket_reply(
         user_id=current_user.id
     )
     db.add(db_reply)
+    # The reply and the parent's 'updated_at' bump are committed together
+    db.query(models.Ticket).filter(models.Ticket.id == ticket_id).update({'updated_at': func.now()}, synchronize_session=False)
     db.commit()
     db.refresh(db_reply)
-
-    # Also update the 'updated_at' timestamp of the parent ticket
-    db.query(models.Ticket).filter(models.Ticket.id == ticket_id).update({'updated_at': func.now()})
-    db.commit()
     
     # Here you would trigger a Push Notification to the other party
     # send_notification_for_ticket_reply(db, ticket_id, current_user.id)
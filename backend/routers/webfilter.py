@@ -1,10 +1,19 @@
 # backend/routers/webfilter.py
 
-from fastapi import APIRouter, Depends, Response
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Query, UploadFile, File, Form
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.orm import Session
+from typing import Iterable, Iterator, List, Optional
+import codecs
+import httpx
+import json
+import logging
+import re
 import models, database
 from security import get_current_user
 from dependencies import require_permission
+from webfilter_export import get_blacklist_artifact, get_blacklist_delta, get_profile_index, open_artifact_domains
+from webfilter_import import import_feed, FEED_FORMATS
 
 router = APIRouter(
     prefix="/api/webfilter",
@@ -12,36 +21,194 @@ router = APIRouter(
     dependencies=[Depends(require_permission("webfilter:manage"))]
 )
 
+# Router-level dependencies apply to every route, so the public export lives on its own router
+public_router = APIRouter(
+    prefix="/api/webfilter",
+    tags=["Web Filter"]
+)
+
 # --- CRUD for Filter Profiles, Categories, Sources ---
 # ... (Full CRUD endpoints for managing these in the database)
+# Endpoints that change category links or entries must call
+# webfilter_export.invalidate_profile / invalidate_categories.
 
 @router.get("/profiles")
 def get_filter_profiles(db: Session = Depends(database.get_db)):
     return db.query(models.WebFilterProfile).all()
 
+@router.post("/categories/{category_id}/import")
+def import_category_feed(
+    category_id: int,
+    feed_format: str = Form("plain"),
+    replace: bool = Form(True),
+    csv_column: int = Form(0),
+    source_url: Optional[str] = Form(None),
+    file: Optional[UploadFile] = File(None),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Bulk-loads a blacklist feed (plain list, hosts file or CSV) into a category,
+    either from an uploaded file or streamed from `source_url`.
+    With `replace`, entries missing from the feed are removed from the category.
+    Returns the added/removed counts; progress is written to the log.
+    """
+    if feed_format not in FEED_FORMATS:
+        raise HTTPException(status_code=400, detail=f"feed_format must be one of {', '.join(FEED_FORMATS)}.")
+    if (file is None) == (source_url is None):
+        raise HTTPException(status_code=400, detail="Provide either a file or a source_url.")
+
+    def log_progress(stats: dict):
+        logging.info(f"WebFilter: feed import for category {category_id}: {stats['lines']} lines read, +{stats['added']} so far.")
+
+    if file is not None:
+        lines = codecs.iterdecode(file.file, "utf-8", errors="replace")
+        return import_feed(db, category_id, lines, feed_format, replace, csv_column, progress=log_progress)
+
+    try:
+        with httpx.stream("GET", source_url, timeout=60, follow_redirects=True) as response:
+            response.raise_for_status()
+            return import_feed(db, category_id, response.iter_lines(), feed_format, replace, csv_column, progress=log_progress)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Could not download feed: {e}")
+
+@router.get("/check")
+def check_domain(domain: str, profile_id: int, db: Session = Depends(database.get_db)):
+    """
+    Answers whether a domain is blocked for a profile, either directly or through
+    a blocked parent domain, and which entry and category block it.
+    """
+    profile = db.query(models.WebFilterProfile).filter(models.WebFilterProfile.id == profile_id).first()
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+
+    match = get_profile_index(db, profile).lookup(domain)
+    if match is None:
+        return {"domain": domain, "profile_id": profile_id, "blocked": False}
+    entry, category_id = match
+    return {"domain": domain, "profile_id": profile_id, "blocked": True, "matched_entry": entry, "category_id": category_id}
+
 # --- Public Endpoint for MikroTik to download the blacklist ---
-@router.get(
+@public_router.get(
     "/export/blacklist/{profile_id}.txt",
-    response_class=Response,
-    dependencies=[] # No auth required for this specific endpoint
+    response_class=Response
 )
-def export_blacklist_for_mikrotik(profile_id: int, db: Session = Depends(database.get_db)):
+def export_blacklist_for_mikrotik(profile_id: int, request: Request, db: Session = Depends(database.get_db)):
     """
-    Generates a plain text file of all domains to be blocked for a given profile.
+    Serves the plain text file of all domains to be blocked for a given profile.
     This is the URL the MikroTik script will fetch.
+    The file is prebuilt and only regenerated when the profile's entries change;
+    unchanged lists are answered with 304 Not Modified.
+    """
+    profile = db.query(models.WebFilterProfile).filter(models.WebFilterProfile.id == profile_id).first()
+    if not profile:
+        return Response(content="Profile not found.", status_code=404)
+
+    artifact = get_blacklist_artifact(db, profile)
+
+    use_gzip = "gzip" in request.headers.get("accept-encoding", "")
+    etag = artifact.etag[:-1] + '-gz"' if use_gzip else artifact.etag
+    headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache", "X-Blacklist-Version": str(artifact.version)}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return FileResponse(artifact.gzip_path, media_type="text/plain", headers=headers)
+    return FileResponse(artifact.path, media_type="text/plain", headers=headers)
+
+# --- Public Endpoints for incremental (delta) blacklist sync ---
+
+# Only plain hostnames (optionally wildcarded) are ever written into a RouterOS script
+SAFE_DOMAIN_PATTERN = re.compile(r"^[A-Za-z0-9*_.\-]+$")
+SAFE_LIST_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_\-]+$")
+# Full resyncs are streamed from the artifact file in pieces of about this size
+STREAM_CHUNK_BYTES = 64 * 1024
+
+def _render_delta_script(list_name: str, version: int, added: Iterable[str], removed: Optional[List[str]]) -> Iterator[str]:
+    """
+    Renders a delta as a RouterOS script for `/import`, line by line. `removed=None`
+    means the router's version is unknown, so the list is cleared and rebuilt in
+    full. The script ends by recording the new version in a global variable.
+    """
+    yield "/ip firewall address-list\n"
+    if removed is None:
+        yield f'remove [find where list="{list_name}" and dynamic=no]\n'
+    else:
+        for domain in removed:
+            if SAFE_DOMAIN_PATTERN.match(domain):
+                yield f'remove [find where list="{list_name}" and address="{domain}"]\n'
+    for domain in added:
+        if SAFE_DOMAIN_PATTERN.match(domain):
+            yield f':do {{ add list="{list_name}" address="{domain}" }} on-error={{}}\n'
+    yield ":global webfilterVersion\n"
+    yield f":set webfilterVersion {version}\n"
+
+def _render_full_json(version: int, since: int, domains: Iterable[str]) -> Iterator[str]:
+    """The full-resync JSON document, written piece by piece instead of built in memory."""
+    yield f'{{"version": {version}, "since": {since}, "full": true, "removed": [], "added": ['
+    for i, domain in enumerate(domains):
+        yield (", " if i else "") + json.dumps(domain)
+    yield "]}"
+
+def _chunked(pieces: Iterable[str]) -> Iterator[bytes]:
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= STREAM_CHUNK_BYTES:
+            yield "".join(buffer).encode()
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode()
+
+@public_router.get("/export/delta/{profile_id}.json")
+def export_blacklist_delta(profile_id: int, since: int = 0, db: Session = Depends(database.get_db)):
+    """
+    Returns the domains added and removed since the client's version.
+    `full` is true when `since` is unknown and `added` holds the complete list,
+    streamed from the prebuilt artifact.
     """
     profile = db.query(models.WebFilterProfile).filter(models.WebFilterProfile.id == profile_id).first()
     if not profile:
         return Response(content="Profile not found.", status_code=404)
 
-    # Get all categories linked to this profile
-    linked_categories = [link.category_id for link in profile.categories] # Assuming relationship is defined in model
+    artifact = get_blacklist_artifact(db, profile)
+    delta = get_blacklist_delta(artifact, since)
+    if delta is None:
+        return StreamingResponse(
+            _chunked(_render_full_json(artifact.version, since, open_artifact_domains(artifact))),
+            media_type="application/json"
+        )
+    added, removed = delta
+    return {"version": artifact.version, "since": since, "full": False, "added": added, "removed": removed}
 
-    # Get all blacklist entries from those categories
-    entries = db.query(models.BlacklistEntry.entry).filter(
-        models.BlacklistEntry.category_id.in_(linked_categories)
-    ).all()
+@public_router.get("/export/delta/{profile_id}.rsc", response_class=Response)
+def export_blacklist_delta_script(
+    profile_id: int,
+    since: int = 0,
+    list_name: str = Query("Blocked_Domains_By_Platform", alias="list"),
+    db: Session = Depends(database.get_db)
+):
+    """
+    The delta as a RouterOS script, fetched and imported by the delta variant of
+    the MikroTik web filter script. Unchanged lists produce a script with no changes.
+    """
+    if not SAFE_LIST_NAME_PATTERN.match(list_name):
+        return Response(content="Invalid list name.", status_code=400)
+
+    profile = db.query(models.WebFilterProfile).filter(models.WebFilterProfile.id == profile_id).first()
+    if not profile:
+        return Response(content="Profile not found.", status_code=404)
 
-    content = "\n".join([entry[0] for entry in entries])
-    
-    return Response(content=content, media_type="text/plain")
+    artifact = get_blacklist_artifact(db, profile)
+    delta = get_blacklist_delta(artifact, since)
+    headers = {"X-Blacklist-Version": str(artifact.version)}
+    if delta is None:
+        # Full resync: streamed from the artifact file rather than built in memory
+        script = _render_delta_script(list_name, artifact.version, open_artifact_domains(artifact), None)
+        return StreamingResponse(_chunked(script), media_type="text/plain", headers=headers)
+    added, removed = delta
+    script = "".join(_render_delta_script(list_name, artifact.version, added, removed))
+    return Response(content=script, media_type="text/plain", headers=headers)
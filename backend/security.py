@@ -1,7 +1,9 @@
 # backend/security.py
 
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Tuple, Union
+import threading
+import time
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
@@ -29,9 +31,18 @@ ALGORITHM = "HS256"
 # SECRET_KEY is loaded from .env via config.py
 SECRET_KEY = settings.SECRET_KEY
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    """Creates a new JWT access token."""
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None, user: Optional[models.User] = None):
+    """
+    Creates a new JWT access token.
+    When JWT_SELF_CONTAINED is enabled and `user` is given, the token also carries
+    the claims needed to authenticate later requests without a user lookup.
+    """
     to_encode = data.copy()
+    if settings.JWT_SELF_CONTAINED and user is not None:
+        to_encode.update({
+            "uid": user.id,
+            "ver": user.token_version or 0,
+        })
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
@@ -40,6 +51,75 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# --- Token Revocation / Version Cache ---
+# user_id -> (expires_at, token_version, is_active, role_id). A self-contained token
+# is only accepted while its "ver" claim matches and the user is still active.
+# Authorization uses the role from here, not from the token, so a role change or
+# deactivation applies to issued tokens within TOKEN_STATE_TTL_SECONDS.
+TOKEN_STATE_TTL_SECONDS = 60
+
+_token_state: Dict[int, Tuple[float, int, bool, Optional[int]]] = {}
+_token_state_lock = threading.Lock()
+
+def _get_token_state(db: Session, user_id: int) -> Optional[Tuple[int, bool, Optional[int]]]:
+    cached = _token_state.get(user_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1], cached[2], cached[3]
+    row = db.query(models.User.token_version, models.User.is_active, models.User.role_id).filter(models.User.id == user_id).first()
+    if row is None:
+        return None
+    state = (row[0] or 0, bool(row[1]), row[2])
+    with _token_state_lock:
+        _token_state[user_id] = (time.monotonic() + TOKEN_STATE_TTL_SECONDS, *state)
+    return state
+
+def invalidate_token_state(user_id: int):
+    """Forget the cached version/active/role state, e.g. after a user was deactivated or given another role."""
+    with _token_state_lock:
+        _token_state.pop(user_id, None)
+
+def revoke_user_tokens(db: Session, user_id: int):
+    """Invalidates every token issued to a user so far (also use after a role change)."""
+    db.query(models.User).filter(models.User.id == user_id).update(
+        {models.User.token_version: models.User.token_version + 1}, synchronize_session=False
+    )
+    db.commit()
+    invalidate_token_state(user_id)
+
+class TokenUser:
+    """
+    The user as described by a self-contained token. id and username come from the
+    claims, role_id and is_active from the cached token state; any other attribute
+    loads the full ORM user from the database on first access.
+    """
+    def __init__(self, payload: dict, db: Session, role_id: Optional[int], is_active: bool):
+        self.id = payload["uid"]
+        self.username = payload["sub"]
+        self.role_id = role_id
+        self.is_active = is_active
+        self._db = db
+        self._user = None
+
+    def __getattr__(self, name):
+        # Only called for attributes not set in __init__
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if self._user is None:
+            self._user = self._db.query(models.User).filter(models.User.id == self.id).first()
+            if self._user is None:
+                raise AttributeError(name)
+        return getattr(self._user, name)
+
+def _user_from_claims(payload: dict, db: Session) -> Optional[TokenUser]:
+    """Returns a TokenUser if the self-contained claims are still valid, else None."""
+    state = _get_token_state(db, payload["uid"])
+    if state is None:
+        return None
+    token_version, is_active, role_id = state
+    if payload.get("ver") != token_version or not is_active:
+        return None
+    return TokenUser(payload, db, role_id, is_active)
+
 # --- Security Dependencies for HTTP Requests ---
 
 # This scheme will look for the 'Authorization: Bearer <token>' header
@@ -54,10 +134,11 @@ credentials_exception = HTTPException(
 async def get_current_user_from_token(
     token: str = Depends(oauth2_scheme), 
     db: Session = Depends(database.get_db)
-) -> models.User:
+) -> Union[models.User, TokenUser]:
     """
     Dependency to get the current user from a JWT in an HTTP Authorization header.
-    It returns the full SQLAlchemy User object.
+    It returns the full SQLAlchemy User object, or a TokenUser that loads it lazily
+    when the token is self-contained.
     """
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -67,6 +148,12 @@ async def get_current_user_from_token(
     except JWTError:
         raise credentials_exception
     
+    if settings.JWT_SELF_CONTAINED and "uid" in payload:
+        user = _user_from_claims(payload, db)
+        if user is None:
+            raise credentials_exception
+        return user
+
     user = db.query(models.User).filter(models.User.username == username).first()
     if user is None:
         raise credentials_exception
@@ -75,7 +162,7 @@ async def get_current_user_from_token(
 
 async def get_current_active_user(
     current_user: models.User = Depends(get_current_user_from_token)
-) -> models.User:
+) -> Union[models.User, TokenUser]:
     """Dependency that builds on top of the previous one to also check if the user is active."""
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
@@ -86,7 +173,7 @@ async def get_current_active_user(
 async def get_user_from_token_ws(
     token: str, # The token is passed as a query parameter
     db: Session
-) -> Optional[models.User]:
+) -> Optional[Union[models.User, TokenUser]]:
     """
     Authenticates a user for a WebSocket connection using a token from query parameters.
     Returns the User object or None if authentication fails.
@@ -103,6 +190,9 @@ async def get_user_from_token_ws(
     except JWTError:
         return None
     
+    if settings.JWT_SELF_CONTAINED and "uid" in payload:
+        return _user_from_claims(payload, db)
+
     user = db.query(models.User).filter(models.User.username == username).first()
     
     if user is None or not user.is_active:
@@ -0,0 +1,292 @@
+# backend/webfilter_export.py
+
+import contextlib
+import fcntl
+import glob
+import gzip
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session
+
+import models
+from webfilter_index import DomainIndex, build_profile_index, domain_key, indexes
+
+# Prebuilt blacklist files, one plain and one gzip artifact per profile
+EXPORT_DIR = "exports/webfilter"
+# How often a served artifact is checked against the database for changes
+RECHECK_INTERVAL_SECONDS = 60
+# Older versions kept on disk so routers can fetch deltas against them
+KEEP_VERSIONS = 10
+
+class BlacklistArtifact:
+    def __init__(self, profile_id: int, version: int, signature: tuple, etag: str, path: str, gzip_path: str, size: int):
+        self.profile_id = profile_id
+        self.version = version
+        self.signature = signature
+        self.etag = etag
+        self.path = path
+        self.gzip_path = gzip_path
+        self.size = size
+        self.built_at = time.time()
+        self.checked_at = time.monotonic()
+        self.dirty = False
+
+# profile_id -> current artifact
+artifacts: Dict[int, BlacklistArtifact] = {}
+_build_locks: Dict[int, threading.Lock] = {}
+_locks_guard = threading.Lock()
+# (profile_id, since_version, version) -> (added, removed); many routers share the same 'since'
+_delta_cache: Dict[Tuple[int, int, int], Tuple[List[str], List[str]]] = {}
+
+def _get_build_lock(profile_id: int) -> threading.Lock:
+    with _locks_guard:
+        if profile_id not in _build_locks:
+            _build_locks[profile_id] = threading.Lock()
+        return _build_locks[profile_id]
+
+def _get_category_ids(profile: models.WebFilterProfile) -> List[int]:
+    return sorted(link.category_id for link in profile.categories)
+
+def _compute_signature(db: Session, category_ids: List[int]) -> tuple:
+    """
+    A cheap fingerprint of the entries behind a profile: the linked categories plus
+    the row count, highest id and revision of each. It changes whenever entries are
+    added, removed or rewritten without reading the entries themselves.
+    """
+    if not category_ids:
+        return ()
+    revisions = dict(db.query(models.BlacklistRevision.category_id, models.BlacklistRevision.revision).filter(
+        models.BlacklistRevision.category_id.in_(category_ids)
+    ).all())
+    rows = db.query(
+        models.BlacklistEntry.category_id,
+        func.count(models.BlacklistEntry.id),
+        func.max(models.BlacklistEntry.id)
+    ).filter(
+        models.BlacklistEntry.category_id.in_(category_ids)
+    ).group_by(models.BlacklistEntry.category_id).all()
+    counts = {row[0]: (row[1], row[2]) for row in rows}
+    return tuple((cid, *counts.get(cid, (0, None)), revisions.get(cid, 0)) for cid in category_ids)
+
+def bump_category_revisions(db: Session, category_ids: List[int]):
+    """
+    Records that entries of these categories were rewritten in place, which count
+    and highest id don't show, so every worker rebuilds the affected artifacts.
+    """
+    table = models.BlacklistRevision.__table__
+    for category_id in category_ids:
+        stmt = mysql_insert(table).values(category_id=category_id, revision=1)
+        db.execute(stmt.on_duplicate_key_update(revision=table.c.revision + 1))
+    db.commit()
+
+def _version_path(profile_id: int, version: int) -> str:
+    return os.path.join(EXPORT_DIR, f"profile_{profile_id}.v{version}.txt")
+
+def _list_versions(profile_id: int) -> List[int]:
+    pattern = re.compile(rf"profile_{profile_id}\.v(\d+)\.txt$")
+    versions = []
+    for path in glob.glob(os.path.join(EXPORT_DIR, f"profile_{profile_id}.v*.txt")):
+        match = pattern.search(path)
+        if match:
+            versions.append(int(match.group(1)))
+    return sorted(versions)
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+@contextlib.contextmanager
+def _publish_lock(profile_id: int):
+    """
+    Serializes publishing a profile's versions across worker processes, so the
+    version number is always chosen from what is on disk, not from this process's view.
+    """
+    with open(os.path.join(EXPORT_DIR, f"profile_{profile_id}.lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _prune_versions(profile_id: int):
+    for version in _list_versions(profile_id)[:-KEEP_VERSIONS]:
+        for path in (_version_path(profile_id, version), _version_path(profile_id, version) + ".gz"):
+            if os.path.exists(path):
+                os.remove(path)
+
+def _build_artifact(db: Session, profile_id: int, category_ids: List[int], signature: tuple) -> BlacklistArtifact:
+    """
+    Compiles the profile's domain index and writes it out as a new version of the
+    blacklist. The index is deduplicated, has covered subdomains collapsed and is
+    kept in index order, so any two versions can be diffed with a streaming merge.
+    """
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    # Unique per build: another worker may be building the same profile right now
+    tmp_path = os.path.join(EXPORT_DIR, f"profile_{profile_id}.building.{uuid.uuid4().hex}.txt")
+    tmp_gzip_path = tmp_path + ".gz"
+
+    digest = hashlib.sha256()
+    size = 0
+    started = time.monotonic()
+
+    index = build_profile_index(db, profile_id, category_ids)
+
+    try:
+        with open(tmp_path, "wb") as plain, gzip.open(tmp_gzip_path, "wb", compresslevel=6) as compressed:
+            first = True
+            for entry in index.domains():
+                line = (entry if first else "\n" + entry).encode()
+                first = False
+                plain.write(line)
+                compressed.write(line)
+                digest.update(line)
+                size += len(line)
+    except BaseException:
+        for path in (tmp_path, tmp_gzip_path):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+
+    etag = f'"{digest.hexdigest()}"'
+    with _publish_lock(profile_id):
+        versions = _list_versions(profile_id)
+        if versions and _file_digest(_version_path(profile_id, versions[-1])) == digest.hexdigest():
+            # Nothing actually changed (or another worker published the same content):
+            # keep the existing version so routers that are up to date get an empty delta.
+            os.remove(tmp_path)
+            os.remove(tmp_gzip_path)
+            version = versions[-1]
+        else:
+            version = max(int(time.time()), versions[-1] + 1 if versions else 0)
+            path = _version_path(profile_id, version)
+            os.replace(tmp_gzip_path, path + ".gz")
+            os.replace(tmp_path, path) # Last: the .txt appearing is what makes the version visible
+            _prune_versions(profile_id)
+    for key in [k for k in _delta_cache if k[0] == profile_id]:
+        del _delta_cache[key]
+
+    path = _version_path(profile_id, version)
+    logging.info(
+        f"WebFilter: built blacklist for profile {profile_id} version {version}: "
+        f"{len(index)} of {index.raw_entries} entries, {size} bytes, {time.monotonic() - started:.1f}s."
+    )
+    return BlacklistArtifact(profile_id, version, signature, etag, path, path + ".gz", size)
+
+def _is_current(artifact: Optional[BlacklistArtifact]) -> bool:
+    if not artifact or artifact.dirty or time.monotonic() - artifact.checked_at >= RECHECK_INTERVAL_SECONDS:
+        return False
+    # Another worker may have published a newer version; serving ours would hand out stale deltas
+    return _list_versions(artifact.profile_id)[-1:] == [artifact.version]
+
+def get_blacklist_artifact(db: Session, profile: models.WebFilterProfile) -> BlacklistArtifact:
+    """
+    Returns the current export artifact for a profile, rebuilding it only when the
+    profile's categories or their entries have changed.
+    """
+    artifact = artifacts.get(profile.id)
+    if _is_current(artifact):
+        return artifact
+
+    with _get_build_lock(profile.id):
+        # Another request may have rebuilt it while we waited
+        artifact = artifacts.get(profile.id)
+        if _is_current(artifact):
+            return artifact
+
+        category_ids = _get_category_ids(profile)
+        signature = _compute_signature(db, category_ids)
+        if artifact and not artifact.dirty and artifact.signature == signature and _list_versions(profile.id)[-1:] == [artifact.version]:
+            artifact.checked_at = time.monotonic()
+            return artifact
+
+        artifact = _build_artifact(db, profile.id, category_ids, signature)
+        artifacts[profile.id] = artifact
+        return artifact
+
+def invalidate_categories(category_ids: Optional[List[int]] = None):
+    """
+    Marks artifacts stale after their blacklist entries or category links change.
+    With no argument every artifact is marked. The rebuild happens on the next fetch.
+    """
+    for artifact in artifacts.values():
+        if category_ids is None or any(entry[0] in category_ids for entry in artifact.signature):
+            artifact.dirty = True
+
+def invalidate_profile(profile_id: int):
+    """Marks a profile's artifact stale, e.g. after categories were linked or unlinked."""
+    artifact = artifacts.get(profile_id)
+    if artifact:
+        artifact.dirty = True
+
+def _read_lines(path: str) -> Iterator[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line:
+                yield line
+
+def open_artifact_domains(artifact: BlacklistArtifact) -> Iterator[str]:
+    """
+    Iterates the artifact's domains line by line. The file is opened right away,
+    so the iterator keeps working if the version is pruned while it is consumed.
+    """
+    f = open(artifact.path, "r", encoding="utf-8")
+
+    def lines():
+        with f:
+            for line in f:
+                line = line.rstrip("\n")
+                if line:
+                    yield line
+    return lines()
+
+def _diff_sorted(old_path: str, new_path: str) -> Tuple[List[str], List[str]]:
+    """Streaming merge of two version files, both written in index order."""
+    added, removed = [], []
+    old_lines, new_lines = _read_lines(old_path), _read_lines(new_path)
+    old, new = next(old_lines, None), next(new_lines, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and domain_key(old) < domain_key(new)):
+            removed.append(old)
+            old = next(old_lines, None)
+        elif old is None or domain_key(new) < domain_key(old):
+            added.append(new)
+            new = next(new_lines, None)
+        else:
+            old, new = next(old_lines, None), next(new_lines, None)
+    return added, removed
+
+def get_blacklist_delta(artifact: BlacklistArtifact, since_version: int) -> Optional[Tuple[List[str], List[str]]]:
+    """
+    Returns (added, removed) between `since_version` and the artifact's version,
+    or None when that version is no longer on disk and a full resync is needed.
+    """
+    if since_version == artifact.version:
+        return [], []
+    key = (artifact.profile_id, since_version, artifact.version)
+    if key not in _delta_cache:
+        old_path = _version_path(artifact.profile_id, since_version)
+        if not os.path.exists(old_path):
+            return None
+        _delta_cache[key] = _diff_sorted(old_path, artifact.path)
+    return _delta_cache[key]
+
+def get_profile_index(db: Session, profile: models.WebFilterProfile) -> DomainIndex:
+    """Returns the compiled domain index for a profile, rebuilt together with its export."""
+    get_blacklist_artifact(db, profile)
+    if profile.id not in indexes:
+        # The artifact was current but this process hasn't compiled the index yet
+        indexes[profile.id] = build_profile_index(db, profile.id, _get_category_ids(profile))
+    return indexes[profile.id]
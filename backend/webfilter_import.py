@@ -0,0 +1,167 @@
+# backend/webfilter_import.py
+
+import csv
+import logging
+import time
+from typing import Callable, Iterable, Iterator, Optional
+
+from sqlalchemy import text
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session
+
+import models
+from webfilter_index import normalize_domain
+from webfilter_export import bump_category_revisions, invalidate_categories
+
+BATCH_SIZE = 5000
+PROGRESS_EVERY_LINES = 100000
+FEED_FORMATS = ("plain", "hosts", "csv")
+
+# Hostnames that hosts-file feeds map to themselves and must never be blocked
+HOSTS_FILE_IGNORED = {"localhost", "localhost.localdomain", "local", "broadcasthost", "ip6-localhost", "ip6-loopback", "0.0.0.0"}
+
+# normalize_domain() in SQL, for entries stored before imports normalized them.
+# BINARY makes the comparison case-sensitive despite the column's collation.
+_CLEANED_ENTRY = "LOWER(TRIM(TRAILING '.' FROM TRIM(entry)))"
+_NORMALIZED_ENTRY = f"CASE WHEN {_CLEANED_ENTRY} LIKE '*.%' THEN SUBSTRING({_CLEANED_ENTRY}, 3) ELSE {_CLEANED_ENTRY} END"
+_LEGACY_ENTRY = f"BINARY entry <> BINARY ({_NORMALIZED_ENTRY})"
+
+def parse_feed(lines: Iterable[str], feed_format: str, csv_column: int = 0) -> Iterator[str]:
+    """Yields the raw domain of every usable line in a plain, hosts-file or CSV feed."""
+    if feed_format == "csv":
+        for row in csv.reader(lines):
+            if row and len(row) > csv_column and not row[0].startswith("#"):
+                yield row[csv_column]
+        return
+
+    for line in lines:
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        if feed_format == "hosts":
+            # "0.0.0.0 ads.example.com [alias ...]"
+            for hostname in line.split()[1:]:
+                if hostname.lower() not in HOSTS_FILE_IGNORED:
+                    yield hostname
+        else:
+            yield line.split()[0]
+
+def _insert_batch(db: Session, category_id: int, batch: list) -> int:
+    """Upserts one batch in its own transaction; returns how many rows were new."""
+    # rowcount can't tell inserts from duplicates (the driver reports found rows), so count them first
+    existing = db.query(models.BlacklistEntry.entry).filter(
+        models.BlacklistEntry.category_id == category_id,
+        models.BlacklistEntry.entry.in_(batch)
+    ).count()
+    stmt = mysql_insert(models.BlacklistEntry.__table__).values(
+        [{"category_id": category_id, "entry": domain} for domain in batch]
+    )
+    stmt = stmt.on_duplicate_key_update(entry=stmt.inserted.entry)
+    db.execute(stmt)
+    db.commit()
+    return len(batch) - existing
+
+def _delete_batch(db: Session, ids: list):
+    db.query(models.BlacklistEntry).filter(models.BlacklistEntry.id.in_(ids)).delete(synchronize_session=False)
+    db.commit()
+
+def _normalize_existing(db: Session, category_id: int) -> int:
+    """
+    Rewrites entries stored before imports normalized them (mixed case, wildcards,
+    trailing dots) to their normalized form. Otherwise the case-insensitive unique
+    key treats 'Ads.example.com' as the feed's 'ads.example.com' while replace mode
+    sees them as different. Entries whose normalized form already exists are deleted.
+    Runs set-based in the database and only writes when legacy entries exist.
+    Returns how many rows changed.
+    """
+    params = {"category_id": category_id}
+    has_legacy = db.execute(text(
+        f"SELECT 1 FROM blacklist_entries WHERE category_id = :category_id AND {_LEGACY_ENTRY} LIMIT 1"
+    ), params).first()
+    if not has_legacy:
+        return 0
+    # IGNORE skips the rows whose normalized form is already taken...
+    updated = db.execute(text(
+        f"UPDATE IGNORE blacklist_entries SET entry = {_NORMALIZED_ENTRY} WHERE category_id = :category_id AND {_LEGACY_ENTRY}"
+    ), params).rowcount
+    # ...so whatever is still legacy duplicates an existing entry
+    deleted = db.execute(text(
+        f"DELETE FROM blacklist_entries WHERE category_id = :category_id AND {_LEGACY_ENTRY}"
+    ), params).rowcount
+    db.commit()
+    # Other workers' signatures can't see in-place rewrites otherwise
+    bump_category_revisions(db, [category_id])
+    logging.info(f"WebFilter: normalized {updated} and removed {deleted} legacy entries in category {category_id}.")
+    return updated + deleted
+
+def import_feed(
+    db: Session,
+    category_id: int,
+    lines: Iterable[str],
+    feed_format: str = "plain",
+    replace: bool = True,
+    csv_column: int = 0,
+    progress: Optional[Callable[[dict], None]] = None
+) -> dict:
+    """
+    Loads a category feed into BlacklistEntry.
+    Entries are normalized and deduplicated, then upserted in batches of BATCH_SIZE
+    with one transaction per batch. With `replace`, entries of the category that are
+    no longer in the feed are deleted afterwards. `progress` is called periodically
+    and at the end with the running counters.
+    """
+    if feed_format not in FEED_FORMATS:
+        raise ValueError(f"Unknown feed format '{feed_format}'.")
+
+    stats = {"category_id": category_id, "lines": 0, "invalid": 0, "duplicates": 0, "unique": 0, "added": 0, "removed": 0}
+    started = time.monotonic()
+    stats["normalized"] = _normalize_existing(db, category_id)
+    seen = set()
+    batch = []
+
+    def report(done: bool = False):
+        if progress:
+            progress({**stats, "done": done, "elapsed_s": round(time.monotonic() - started, 2)})
+
+    for raw in parse_feed(lines, feed_format, csv_column):
+        stats["lines"] += 1
+        domain = normalize_domain(raw)
+        if domain is None:
+            stats["invalid"] += 1
+        elif domain in seen:
+            stats["duplicates"] += 1
+        else:
+            seen.add(domain)
+            batch.append(domain)
+            if len(batch) >= BATCH_SIZE:
+                stats["added"] += _insert_batch(db, category_id, batch)
+                batch = []
+        if stats["lines"] % PROGRESS_EVERY_LINES == 0:
+            report()
+
+    if batch:
+        stats["added"] += _insert_batch(db, category_id, batch)
+    stats["unique"] = len(seen)
+
+    if replace:
+        # Stream the category's current rows and delete those the feed no longer lists
+        stale_ids = []
+        existing = db.query(models.BlacklistEntry.id, models.BlacklistEntry.entry).filter(
+            models.BlacklistEntry.category_id == category_id
+        ).yield_per(BATCH_SIZE)
+        for entry_id, entry in existing:
+            if entry not in seen:
+                stale_ids.append(entry_id)
+        for i in range(0, len(stale_ids), BATCH_SIZE):
+            _delete_batch(db, stale_ids[i:i + BATCH_SIZE])
+        stats["removed"] = len(stale_ids)
+
+    if stats["added"] or stats["removed"] or stats["normalized"]:
+        invalidate_categories([category_id])
+
+    logging.info(
+        f"WebFilter: imported feed into category {category_id}: {stats['unique']} unique entries, "
+        f"+{stats['added']} / -{stats['removed']} in {time.monotonic() - started:.1f}s."
+    )
+    report(done=True)
+    return stats
@@ -0,0 +1,90 @@
+# backend/webfilter_index.py
+
+import bisect
+import re
+from array import array
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+import models
+
+BUILD_BATCH_SIZE = 10000
+
+# Separates labels in index keys. It sorts below every character allowed in a
+# domain, so a domain's subdomains always sort directly after it.
+LABEL_SEPARATOR = " "
+DOMAIN_PATTERN = re.compile(r"^[a-z0-9_\-]+(\.[a-z0-9_\-]+)*$")
+
+def normalize_domain(raw: str) -> Optional[str]:
+    """Lowercases and cleans a blacklist entry or lookup; returns None if it isn't a domain."""
+    domain = raw.strip().lower().rstrip(".")
+    if domain.startswith("*."):
+        domain = domain[2:] # A wildcard is the same as blocking the parent domain
+    if not domain or len(domain) > 253 or not DOMAIN_PATTERN.match(domain):
+        return None
+    return domain
+
+def domain_key(domain: str) -> str:
+    """'ads.example.com' -> 'com example ads'"""
+    return LABEL_SEPARATOR.join(reversed(domain.split(".")))
+
+def key_to_domain(key: str) -> str:
+    return ".".join(reversed(key.split(LABEL_SEPARATOR)))
+
+class DomainIndex:
+    """
+    Compiled, read-only blacklist for one profile: a sorted array of reversed-label
+    keys. Duplicates are removed and subdomains of an already blocked domain are
+    collapsed into it, so a lookup is a single binary search.
+    """
+    def __init__(self, entries: Iterable[Tuple[str, int]]):
+        best: Dict[str, int] = {}
+        self.raw_entries = 0
+        for raw, category_id in entries:
+            self.raw_entries += 1
+            domain = normalize_domain(raw)
+            if domain is not None:
+                best.setdefault(domain_key(domain), category_id)
+
+        self.keys = []
+        self.category_ids = array("i")
+        for key in sorted(best):
+            # Sorted order puts every subdomain right after its kept parent (if any)
+            if self.keys and key.startswith(self.keys[-1] + LABEL_SEPARATOR):
+                continue
+            self.keys.append(key)
+            self.category_ids.append(best[key])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, domain: str) -> Optional[Tuple[str, int]]:
+        """Returns (blocking entry, category id) if the domain or one of its parents is blocked."""
+        normalized = normalize_domain(domain)
+        if normalized is None:
+            return None
+        key = domain_key(normalized)
+        position = bisect.bisect_right(self.keys, key) - 1
+        if position < 0:
+            return None
+        candidate = self.keys[position]
+        if key == candidate or key.startswith(candidate + LABEL_SEPARATOR):
+            return key_to_domain(candidate), self.category_ids[position]
+        return None
+
+    def domains(self) -> Iterator[str]:
+        """The collapsed domain list, in index order."""
+        for key in self.keys:
+            yield key_to_domain(key)
+
+# profile_id -> compiled index; rebuilt together with the profile's export artifact
+indexes: Dict[int, DomainIndex] = {}
+
+def build_profile_index(db: Session, profile_id: int, category_ids) -> DomainIndex:
+    rows = db.query(models.BlacklistEntry.entry, models.BlacklistEntry.category_id).filter(
+        models.BlacklistEntry.category_id.in_(category_ids)
+    ).yield_per(BUILD_BATCH_SIZE) if category_ids else []
+    index = DomainIndex(rows)
+    indexes[profile_id] = index
+    return index
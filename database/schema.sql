@@ -32,6 +32,7 @@ CREATE TABLE `users` (
   `user_type` enum('admin','end_user') NOT NULL DEFAULT 'end_user',
   `auth_source` varchar(50) NOT NULL DEFAULT 'local',
   `external_id` varchar(255) DEFAULT NULL,
+  `token_version` int(11) NOT NULL DEFAULT 0,
   PRIMARY KEY (`id`),
   UNIQUE KEY `username` (`username`),
   UNIQUE KEY `email` (`email`),
@@ -40,7 +41,7 @@ CREATE TABLE `users` (
   CONSTRAINT `users_ibfk_1` FOREIGN KEY (`role_id`) REFERENCES `roles` (`id`)
 ) ENGINE=InnoDB;
 -- Default password is 'admin'
-INSERT INTO `users` VALUES (1,'admin','admin@example.com','$2b$12$EixZaYVK1fsbw1yJz2s.W.p3b.h.s.RomiLpYOtM1j.c4AGISU4S.','Main Administrator',1,1,'admin','local',NULL);
+INSERT INTO `users` VALUES (1,'admin','admin@example.com','$2b$12$EixZaYVK1fsbw1yJz2s.W.p3b.h.s.RomiLpYOtM1j.c4AGISU4S.','Main Administrator',1,1,'admin','local',NULL,0);
 
 --
 -- Table structure for `permissions` and `role_permissions`
@@ -83,6 +84,124 @@ CREATE TABLE `devices` (
   UNIQUE KEY `name` (`name`)
 ) ENGINE=InnoDB;
 
+--
+-- Table structure for `blacklist_entries`
+-- The unique key lets feed imports upsert with INSERT ... ON DUPLICATE KEY UPDATE.
+--
+DROP TABLE IF EXISTS `blacklist_entries`;
+CREATE TABLE `blacklist_entries` (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `category_id` int(11) NOT NULL,
+  `entry` varchar(253) NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `category_entry` (`category_id`,`entry`)
+) ENGINE=InnoDB;
+
+--
+-- Table structure for `blacklist_revisions`
+-- Bumped when entries of a category are rewritten in place, which row count
+-- and highest id don't reveal, so every worker rebuilds its export artifacts.
+--
+DROP TABLE IF EXISTS `blacklist_revisions`;
+CREATE TABLE `blacklist_revisions` (
+  `category_id` int(11) NOT NULL,
+  `revision` int(11) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`category_id`)
+) ENGINE=InnoDB;
+
+--
+-- Table structure for `tickets` and `ticket_replies`
+-- Ticket lists are keyset-paginated on (updated_at, id); each filter has a
+-- composite index ending in that sort key. FULLTEXT indexes back ticket search
+-- and are maintained by InnoDB on every write.
+--
+DROP TABLE IF EXISTS `tickets`;
+CREATE TABLE `tickets` (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `title` varchar(255) NOT NULL,
+  `status` varchar(20) NOT NULL DEFAULT 'open',
+  `created_by_user_id` int(11) NOT NULL,
+  `assigned_to_user_id` int(11) DEFAULT NULL,
+  `created_at` datetime NOT NULL DEFAULT current_timestamp(),
+  `updated_at` datetime NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
+  PRIMARY KEY (`id`),
+  KEY `idx_tickets_updated` (`updated_at`,`id`),
+  KEY `idx_tickets_status_updated` (`status`,`updated_at`,`id`),
+  KEY `idx_tickets_assignee_updated` (`assigned_to_user_id`,`updated_at`,`id`),
+  KEY `idx_tickets_creator_updated` (`created_by_user_id`,`updated_at`,`id`),
+  FULLTEXT KEY `ft_tickets_title` (`title`),
+  CONSTRAINT `tickets_ibfk_1` FOREIGN KEY (`created_by_user_id`) REFERENCES `users` (`id`),
+  CONSTRAINT `tickets_ibfk_2` FOREIGN KEY (`assigned_to_user_id`) REFERENCES `users` (`id`)
+) ENGINE=InnoDB;
+
+DROP TABLE IF EXISTS `ticket_replies`;
+CREATE TABLE `ticket_replies` (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `ticket_id` int(11) NOT NULL,
+  `user_id` int(11) NOT NULL,
+  `message` text NOT NULL,
+  `created_at` datetime NOT NULL DEFAULT current_timestamp(),
+  PRIMARY KEY (`id`),
+  KEY `idx_replies_ticket` (`ticket_id`,`id`),
+  FULLTEXT KEY `ft_replies_message` (`message`),
+  KEY `user_id` (`user_id`),
+  CONSTRAINT `ticket_replies_ibfk_1` FOREIGN KEY (`ticket_id`) REFERENCES `tickets` (`id`) ON DELETE CASCADE,
+  CONSTRAINT `ticket_replies_ibfk_2` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`)
+) ENGINE=InnoDB;
+
+--
+-- Table structure for `chat_messages`
+-- Message ids are 64-bit, time-ordered ids assigned by the application
+-- (see chat_writer.generate_message_id) so messages can be broadcast before
+-- they are written.
+--
+DROP TABLE IF EXISTS `chat_messages`;
+CREATE TABLE `chat_messages` (
+  `id` bigint(20) NOT NULL,
+  `room_id` int(11) NOT NULL,
+  `user_id` int(11) NOT NULL,
+  `message_type` varchar(20) NOT NULL DEFAULT 'text',
+  `text_content` text DEFAULT NULL,
+  `timestamp` datetime(3) NOT NULL,
+  PRIMARY KEY (`id`),
+  KEY `idx_chat_messages_room_time` (`room_id`,`timestamp`,`id`),
+  KEY `user_id` (`user_id`)
+) ENGINE=InnoDB;
+
+--
+-- Table structure for `chat_attachments`
+-- Files are stored once per content (see chat_attachments.py); each row
+-- records that a member of a room uploaded that content to it, which is what
+-- grants the room's members access to the file.
+--
+DROP TABLE IF EXISTS `chat_attachments`;
+CREATE TABLE `chat_attachments` (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `sha256` char(64) NOT NULL,
+  `room_id` int(11) NOT NULL,
+  `uploaded_by_user_id` int(11) NOT NULL,
+  `created_at` datetime NOT NULL DEFAULT current_timestamp(),
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uq_chat_attachments_object_room` (`sha256`,`room_id`),
+  KEY `room_id` (`room_id`),
+  KEY `uploaded_by_user_id` (`uploaded_by_user_id`),
+  CONSTRAINT `chat_attachments_ibfk_1` FOREIGN KEY (`uploaded_by_user_id`) REFERENCES `users` (`id`)
+) ENGINE=InnoDB;
+
+--
+-- Table structure for `chat_worker_leases`
+-- Each running backend process leases one worker number, which it embeds in
+-- the chat message ids it generates, so ids from different processes and
+-- hosts never collide.
+--
+DROP TABLE IF EXISTS `chat_worker_leases`;
+CREATE TABLE `chat_worker_leases` (
+  `worker_id` smallint(6) NOT NULL,
+  `holder` varchar(64) NOT NULL,
+  `expires_at` datetime NOT NULL,
+  PRIMARY KEY (`worker_id`)
+) ENGINE=InnoDB;
+
 --
 -- Add all other tables here...
 -- The following are placeholders for the full CREATE TABLE statements
@@ -94,7 +213,6 @@ DROP TABLE IF EXISTS `docker_hosts`;
 DROP TABLE IF EXISTS `fortigate_devices`;
 DROP TABLE IF EXISTS `unifi_controllers`;
 DROP TABLE IF EXISTS `surveillance_systems`;
-DROP TABLE IF EXISTS `tickets`;
 DROP TABLE IF EXISTS `chat_rooms`;
 DROP TABLE IF EXISTS `audit_logs`;
 -- ... and so on for all other tables.